@@ -0,0 +1,145 @@
+"""
+Animation - Live animation of a Solar simulation with the physics in a background thread
+The worker steps the simulation and writes every few steps into a bounded ring buffer of frames, the renderer takes
+one frame per draw and only redraws the planets (blitting), so a slow step no longer stalls the window and the
+frame rate no longer caps how fast the simulated time passes
+"""
+
+from matplotlib.animation import FuncAnimation
+import matplotlib.pyplot as plt
+import numpy as np
+import threading
+import time
+import math
+
+
+class FrameBuffer:
+    """ A thread-safe ring buffer of preallocated frames (time and positions), the writer waits while it is full """
+    def __init__(self, capacity, n_bodies):
+        self.capacity = capacity
+        self.times = np.zeros(capacity)
+        self.positions = np.zeros((capacity, n_bodies, 2))
+        self.start = 0
+        self.count = 0
+        self.closed = False
+        self._condition = threading.Condition()
+
+    def put(self, time_passed, positions):
+        """ Copies a frame in, returns False if the buffer was closed while waiting for space """
+        with self._condition:
+            while self.count == self.capacity and not self.closed:
+                self._condition.wait()
+            if self.closed:
+                return False
+            end = (self.start + self.count) % self.capacity
+            self.times[end] = time_passed
+            self.positions[end] = positions
+            self.count += 1
+            return True
+
+    def get(self, out):
+        """ Copies the oldest frame into out and returns its time, or None if no frame is ready yet """
+        with self._condition:
+            if self.count == 0:
+                return None
+            out[...] = self.positions[self.start]
+            time_passed = self.times[self.start]
+            self.start = (self.start + 1) % self.capacity
+            self.count -= 1
+            self._condition.notify()
+            return time_passed
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+
+class PhysicsWorker(threading.Thread):
+    """ Runs steps_per_frame simulation steps for every frame it writes, and measures its rate of steps per second """
+    def __init__(self, solar, buffer, steps_per_frame=1):
+        super().__init__(daemon=True)
+        self.solar = solar
+        self.buffer = buffer
+        self.steps_per_frame = steps_per_frame
+        self.steps_per_second = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            steps = self.steps_per_frame
+            started = time.perf_counter()
+            for _ in range(steps):
+                self.solar.run_sim()
+            elapsed = time.perf_counter() - started
+            if elapsed > 0:
+                rate = steps / elapsed
+                # Smoothed, so a single slow step (e.g. the garbage collector) does not swing the frame size
+                self.steps_per_second = rate if self.steps_per_second is None else \
+                    0.8 * self.steps_per_second + 0.2 * rate
+            if not self.buffer.put(self.solar.time_passed, self.solar.positions[:self.buffer.positions.shape[1]]):
+                break
+
+    def stop(self):
+        self._stop_event.set()
+        self.buffer.close()
+
+
+class LiveAnimation:
+    def __init__(self, solar, steps_per_frame=1, target_fps=None, buffer_frames=16, max_steps_per_frame=10000):
+        """
+        steps_per_frame: simulation steps between two displayed frames
+        target_fps: adapts steps_per_frame so the worker produces frames at this rate, None keeps it fixed
+        """
+        self.solar = solar
+        self.target_fps = target_fps
+        self.max_steps_per_frame = max_steps_per_frame
+        self.n_bodies = len(solar.planets)
+        self.buffer = FrameBuffer(buffer_frames, self.n_bodies)
+        self.worker = PhysicsWorker(solar, self.buffer, steps_per_frame)
+        self.frame = solar.positions[:self.n_bodies].copy()
+        self.patches = []
+        self.anim = None
+
+    def adapt_steps_per_frame(self):
+        """ As many steps per frame as the worker manages in one frame time at the target frame rate """
+        rate = self.worker.steps_per_second
+        if self.target_fps is None or rate is None:
+            return
+        self.worker.steps_per_frame = int(min(max(rate / self.target_fps, 1), self.max_steps_per_frame))
+
+    def init(self):
+        return self.patches
+
+    def animate(self, i):
+        with self.solar.phase("render"):
+            if self.buffer.get(self.frame) is not None:
+                for j, patch in enumerate(self.patches):
+                    patch.center = (self.frame[j, 0], self.frame[j, 1])
+            self.adapt_steps_per_frame()
+        return self.patches
+
+    def run(self):
+        fig = plt.figure()
+        ax = plt.axes()
+
+        ax.axis("scaled")
+        max_orbit = math.sqrt(np.dot(self.solar.planets[-1].pos[0], self.solar.planets[-1].pos[0])) * 1.15
+        ax.set_xlim(-max_orbit, max_orbit)
+        ax.set_ylim(-max_orbit, max_orbit)
+
+        for planet in self.solar.planets:
+            planet_patch = plt.Circle((planet.pos[0], planet.pos[1]), planet.radius * 750000, color=planet.colour)
+            ax.add_patch(planet_patch)
+            self.patches.append(planet_patch)
+
+        interval = 1 if self.target_fps is None else 1000 / self.target_fps
+        self.anim = FuncAnimation(fig, self.animate, init_func=self.init, interval=interval, blit=True,
+                                  cache_frame_data=False)
+        plt.title("Simulation of the Solar System")
+        self.worker.start()
+        try:
+            plt.show()
+        finally:
+            self.worker.stop()
+            self.worker.join()
@@ -0,0 +1,177 @@
+"""
+Batch - Runs the experiments without any prompts or plots, with explicit parameters, and writes their results as JSON
+    python Batch.py energy --steps 5000 --integrator euler
+    python Batch.py periods --scenario catalog.bin
+    python Batch.py alignment --thresholds 10 20 30 40 50 60 --output alignment.json
+    python Batch.py hohmann --angles 40 41 42 43 44 45 46 47 48 49 50
+    python Batch.py windows --departure-days 800 --flight-days 100 400 --check
+Results are memoized in a ResultCache (.orbital_cache by default). Alignment thresholds and Hohmann launch angles are
+cached one by one, so a sweep that overlaps an earlier one only simulates the values that are new
+"""
+
+from Cache import ResultCache, MISSING
+from Scenario import load_scenario
+import numpy as np
+import argparse
+import json
+import math
+
+
+DAY = 86400
+
+
+def energy(args, scenario, cache):
+    """ Experiments 1 and 7: the total energy after every step, and its largest drift relative to the start """
+    from EnergyConservation import EnergyConservation
+
+    def run():
+        e = EnergyConservation(integrator=args.integrator, timestep=args.timestep, scenario=scenario)
+        while len(e.energies) < args.steps:
+            e.solar.run_sim()
+            e.calc_total_energy()
+        energies = np.array(e.energies)
+        return {"energies": energies, "max_drift": float(np.max(np.abs(energies - energies[0]) / abs(energies[0])))}
+
+    params = {"integrator": args.integrator, "timestep": args.timestep, "steps": args.steps}
+    return params, cache.memoize("energy", params, scenario, run)
+
+
+def periods(args, scenario, cache):
+    """ Experiment 2: the orbital periods relative to Earth's """
+    from OrbitalPeriod import OrbitalPeriod
+    return {}, cache.memoize("periods", {}, scenario, lambda: OrbitalPeriod(scenario).get_relative_periods())
+
+
+def alignment(args, scenario, cache):
+    """ Experiment 3: the years until the planets align again within each threshold (degrees) """
+    from DoomsdayPlanetaryAlignment import DoomsdayPlanetaryAlignment
+    params = {"integrator": args.integrator, "timestep": args.timestep}
+    keys = {threshold: cache.key("alignment", dict(params, threshold=threshold), scenario)
+            for threshold in args.thresholds}
+    years = {threshold: cache.get(key) for threshold, key in keys.items()}
+    missing = [threshold for threshold, year in years.items() if year is MISSING]
+    if missing:     # Every missing threshold is found in one simulation
+        doomsday = DoomsdayPlanetaryAlignment(integrator=args.integrator, timestep=args.timestep, scenario=scenario,
+                                              log_path=None)
+        for threshold, year in doomsday.write_alignment_years(missing):
+            years[threshold] = cache.put(keys[threshold], year)
+    return dict(params, thresholds=args.thresholds), \
+        [{"threshold": threshold, "years": years[threshold]} for threshold in args.thresholds]
+
+
+def hohmann(args, scenario, cache):
+    """
+    Experiment 5: the closest distance (km) between Mars and a satellite launched at each angle (degrees)
+    With the adaptive integrator the step sizes also follow the other satellites of a sweep, which moves a distance
+    by about 1e-8 of itself, so a cached distance may come from a sweep with different angles
+    """
+    from Hohmann import Hohmann
+    adaptive = not args.fixed_step and args.integrator is None
+    params = {"adaptive": adaptive, "integrator": args.integrator, "timestep": args.timestep,
+              "tolerance": args.tolerance}
+    keys = {angle: cache.key("hohmann", dict(params, angle=angle), scenario) for angle in args.angles}
+    distances = {angle: cache.get(key) for angle, key in keys.items()}
+    missing = [angle for angle, distance in distances.items() if distance is MISSING]
+    if missing:     # Every missing angle flies in one simulation
+        h = Hohmann(timestep=args.timestep, adaptive=adaptive, tolerance=args.tolerance, scenario=scenario,
+                    integrator=args.integrator)
+        swept = h.satellite_sweep([angle * math.pi / 180 for angle in missing])[:, 0]
+        for angle, distance in zip(missing, swept):
+            distances[angle] = cache.put(keys[angle], distance)
+    return dict(params, angles=args.angles), \
+        [{"angle": angle, "closest_distance_km": distances[angle]} for angle in args.angles]
+
+
+def windows(args, scenario, cache):
+    """ The cheapest Earth to Mars Lambert transfers (days from the start, m/s), optionally flown in the full system """
+    from Hohmann import Hohmann
+
+    def run():
+        h = Hohmann(timestep=args.timestep, scenario=scenario)
+        departure_times = np.arange(0, args.departure_days + args.resolution_days, args.resolution_days) * DAY
+        flight_times = np.arange(args.flight_days[0], args.flight_days[1] + args.resolution_days,
+                                 args.resolution_days) * DAY
+        found = h.transfer_windows(departure_times, flight_times, count=args.count, check=args.check)
+        results = []
+        for window in found:
+            window, miss = window if args.check else (window, None)
+            result = {"departure_day": window.departure_time / DAY, "flight_days": window.flight_time / DAY,
+                      "departure_dv": window.departure_dv, "arrival_dv": window.arrival_dv,
+                      "total_dv": window.total_dv}
+            if args.check:
+                result["closest_distance_km"] = miss
+            results.append(result)
+        return results
+
+    params = {"timestep": args.timestep, "departure_days": args.departure_days, "flight_days": args.flight_days,
+              "resolution_days": args.resolution_days, "count": args.count, "check": args.check}
+    return params, cache.memoize("windows", params, scenario, run)
+
+
+EXPERIMENTS = {"energy": energy, "periods": periods, "alignment": alignment, "hohmann": hohmann, "windows": windows}
+
+
+def parse_args(argv=None):
+    common = argparse.ArgumentParser(add_help=False)    # The options every experiment takes
+    common.add_argument("--scenario", default="input_params.txt", help="the CSV or catalog file of the bodies")
+    common.add_argument("--output", help="where the results are written (JSON), standard output by default")
+    common.add_argument("--cache-dir", default=".orbital_cache", help="where the results are memoized")
+    common.add_argument("--cache-size", type=float, default=64, help="the most the cache may hold (MB)")
+    common.add_argument("--no-cache", action="store_true", help="always runs the experiment, and stores nothing")
+    parser = argparse.ArgumentParser(description="Runs the orbital experiments headless and writes JSON results")
+    experiments = parser.add_subparsers(dest="experiment", required=True)
+
+    sub = experiments.add_parser("energy", help="total energy per step (experiments 1 and 7)",
+                                 parents=[common])
+    sub.add_argument("--integrator", default="beeman", help="any name from Integrators.INTEGRATORS")
+    sub.add_argument("--timestep", type=float, default=100000)
+    sub.add_argument("--steps", type=int, default=500)
+
+    experiments.add_parser("periods", help="orbital periods relative to Earth (experiment 2)", parents=[common])
+
+    sub = experiments.add_parser("alignment", help="years until the planets align again (experiment 3)",
+                                 parents=[common])
+    sub.add_argument("--integrator", default="beeman", help="any name from Integrators.INTEGRATORS")
+    sub.add_argument("--timestep", type=float, default=100000)
+    sub.add_argument("--thresholds", type=int, nargs="+", default=list(range(10, 61, 5)), help="degrees")
+
+    sub = experiments.add_parser("hohmann", help="closest approach to Mars per launch angle (experiment 5)",
+                                 parents=[common])
+    sub.add_argument("--angles", type=float, nargs="+", default=[float(angle) for angle in range(40, 51)],
+                     help="degrees")
+    sub.add_argument("--timestep", type=float, default=1000)
+    sub.add_argument("--tolerance", type=float, default=1e-10, help="of the adaptive integrator")
+    sub.add_argument("--fixed-step", action="store_true", help="Beeman at --timestep instead of the adaptive dopri5")
+    sub.add_argument("--integrator", help="any other name from Integrators.INTEGRATORS, e.g. block --timestep 86400")
+
+    sub = experiments.add_parser("windows", help="cheapest Lambert transfers to Mars", parents=[common])
+    sub.add_argument("--timestep", type=float, default=10000, help="of the N-body check")
+    sub.add_argument("--departure-days", type=float, default=800, help="latest departure searched")
+    sub.add_argument("--flight-days", type=float, nargs=2, default=[100, 400], help="shortest and longest flight")
+    sub.add_argument("--resolution-days", type=float, default=2)
+    sub.add_argument("--count", type=int, default=5)
+    sub.add_argument("--check", action="store_true", help="also flies every window in the N-body system")
+    return parser.parse_args(argv)
+
+
+def run_batch(args):
+    """ Runs the chosen experiment through the cache and returns everything main writes out """
+    scenario = load_scenario(args.scenario)
+    cache = ResultCache(args.cache_dir, int(args.cache_size * 2 ** 20), enabled=not args.no_cache)
+    params, results = EXPERIMENTS[args.experiment](args, scenario, cache)
+    return {"experiment": args.experiment, "scenario": args.scenario, "scenario_digest": scenario.digest(),
+            "params": params, "cache_hits": cache.hits, "cache_misses": cache.misses, "results": results}
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    output = json.dumps(run_batch(args), indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
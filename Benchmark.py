@@ -0,0 +1,210 @@
+"""
+Benchmark - Measures how fast the simulation and the experiments run, and flags regressions against a baseline
+    python Benchmark.py --output results.json                           Runs the suite and saves the results
+    python Benchmark.py --baseline baseline.json [--tolerance 0.25]     Also compares them with an earlier run
+Every result has a unit and a direction, so any two result files can be compared. The experiments run on reduced
+workloads in a temporary directory, with a copy of input_params.txt, so their text files are not touched
+"""
+
+from Solar import Solar
+from Snapshot import Snapshot
+from Diagnostics import Diagnostics
+from Integrators import INTEGRATORS
+import numpy as np
+import argparse
+import platform
+import tempfile
+import shutil
+import json
+import time
+import os
+import sys
+
+
+def timed(function, repeats=3):
+    """ The best wall time (s) of a few runs of function(), which is the least disturbed by other processes """
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def random_system(n_bodies, seed=0):
+    """ A snapshot of a Sun with n_bodies - 1 Earth-mass planets on circular orbits between Mercury and Jupiter """
+    rng = np.random.default_rng(seed)
+    g = 6.6743E-11
+    sun_mass = 1.989E30
+    n = n_bodies - 1
+    radii = rng.uniform(5e10, 8e11, n)
+    phases = rng.uniform(0, 2 * np.pi, n)
+    speeds = np.sqrt(g * sun_mass / radii)
+    positions = np.zeros((n_bodies, 2))
+    velocities = np.zeros((n_bodies, 2))
+    positions[1:] = radii[:, np.newaxis] * np.stack([np.cos(phases), np.sin(phases)], axis=1)
+    velocities[1:] = speeds[:, np.newaxis] * np.stack([-np.sin(phases), np.cos(phases)], axis=1)
+    masses = np.concatenate([[sun_mass], np.full(n, 5.972E24)])
+    return Snapshot(["Sun"] + ["Body " + str(i) for i in range(n)], masses, np.ones(n_bodies),
+                    ["yellow"] + ["blue"] * n, positions, velocities, np.zeros((n_bodies, 2)),
+                    np.zeros((n_bodies, 2)), n_bodies, 0, 100000, "beeman", g)
+
+
+def make_solar(snapshot, integrator="beeman", force="auto"):
+    solar = Solar(snapshot=snapshot, integrator=integrator, force=force)
+    solar.calc_accels(solar.positions, solar.current_accels)
+    solar.previous_accels[...] = solar.current_accels
+    return solar
+
+
+def bench_body_counts(counts, seconds=0.5):
+    """ Steps per second of the default integrator against the number of bodies """
+    results = {}
+    for n in counts:
+        solar = make_solar(random_system(n))
+        solar.run_sim()     # Warms up the workspaces
+        steps = 0
+        started = time.perf_counter()
+        while time.perf_counter() - started < seconds:
+            solar.run_sim()
+            steps += 1
+        results["steps_per_second/" + str(n) + "_bodies"] = \
+            {"value": steps / (time.perf_counter() - started), "unit": "steps/s", "higher_is_better": True}
+    return results
+
+
+def bench_integrators(steps=2000, drift_years=20):
+    """
+    Cost per step of every integrator on the solar system, and the energy drift over drift_years with the timestep
+    each one is normally used at. drift_x_evaluations multiplies that drift by the force evaluations spent on it, a
+    cost times error score where lower is better
+    """
+    results = {}
+    timesteps = {"wisdom-holman": 1000000, "yoshida4": 300000, "dopri5": 100000, "block": 800000}
+    for name in sorted({cls.name for cls in INTEGRATORS.values()}):
+        solar = Solar(integrator=name)
+        solar.run_sim()
+        started = time.perf_counter()
+        for _ in range(steps):
+            solar.run_sim()
+        results["step_cost/" + name] = {"value": (time.perf_counter() - started) / steps * 1e6, "unit": "us/step",
+                                        "higher_is_better": False}
+
+        solar = Solar(integrator=name, timestep=timesteps.get(name, 100000))
+        diagnostics = Diagnostics(every=100).attach(solar)
+        evaluations = solar.force_evaluations
+        started = time.perf_counter()
+        solar.run_until(drift_years * 3.15576e7)
+        elapsed = time.perf_counter() - started
+        drift = float(np.max(np.abs(diagnostics.drift())))
+        results["energy_drift/" + name] = {"value": drift, "unit": "relative", "higher_is_better": False}
+        results["drift_x_evaluations/" + name] = \
+            {"value": drift * (solar.force_evaluations - evaluations), "unit": "relative x force evaluations",
+             "higher_is_better": False}
+        results["drift_run_time/" + name] = {"value": elapsed, "unit": "s", "higher_is_better": False}
+    return results
+
+
+def bench_experiments():
+    """ End to end time of the RunExperiments experiments on reduced workloads, without their plots and animations """
+    from EnergyConservation import EnergyConservation
+    from OrbitalPeriod import OrbitalPeriod
+    from DoomsdayPlanetaryAlignment import DoomsdayPlanetaryAlignment
+    from Hohmann import Hohmann
+
+    def energy(euler, steps):
+        e = EnergyConservation(euler=euler)
+        for _ in range(steps):
+            e.solar.run_sim()
+            e.calc_total_energy()
+
+    def hohmann():
+        h = Hohmann(adaptive=True)
+        h.satellite_sweep([angle * np.pi / 180 for angle in (42, 44, 46)])
+
+    experiments = {"1_energy_conservation": lambda: energy(False, 500),
+                   "2_orbital_periods": lambda: OrbitalPeriod().write_orbital_periods(),
+                   "3_doomsday_alignment":
+                       lambda: DoomsdayPlanetaryAlignment().write_alignment_years([45, 50, 55, 60]),
+                   "5_hohmann_sweep": hohmann,
+                   "7_energy_conservation_euler": lambda: energy(True, 5000)}
+    results = {}
+    stdout = sys.stdout
+    try:
+        sys.stdout = open(os.devnull, "w")     # The experiments print their results
+        for name, experiment in experiments.items():
+            results["experiment/" + name] = {"value": timed(experiment, repeats=1), "unit": "s",
+                                             "higher_is_better": False}
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return results
+
+
+def run_benchmarks(quick=False):
+    """ Runs the whole suite from a temporary copy of input_params.txt and returns the results as a dict """
+    if not os.path.exists("input_params.txt"):
+        raise FileNotFoundError("Run the benchmarks from the directory with input_params.txt")
+    directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        shutil.copy("input_params.txt", temp_dir)
+        os.chdir(temp_dir)
+        try:
+            results = {}
+            results.update(bench_body_counts([6, 50, 200] if quick else [6, 50, 200, 1000, 5000]))
+            results.update(bench_integrators(steps=500 if quick else 2000, drift_years=5 if quick else 20))
+            if not quick:
+                results.update(bench_experiments())
+        finally:
+            os.chdir(directory)
+    return {"meta": {"date": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+                     "numpy": np.__version__, "machine": platform.machine(), "processor": platform.processor(),
+                     "cpus": os.cpu_count(), "quick": quick},
+            "results": results}
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Returns (name, baseline value, new value, relative change, regressed) for every result both runs have
+    A result regresses when it is worse than the baseline by more than the tolerance (0.25 = 25%)
+    """
+    rows = []
+    for name, result in results["results"].items():
+        if name not in baseline["results"]:
+            continue
+        old, new = baseline["results"][name]["value"], result["value"]
+        change = (new - old) / abs(old) if old else 0.0
+        worse = -change if result["higher_is_better"] else change
+        rows.append((name, old, new, change, worse > tolerance))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the Solar simulation and its experiments")
+    parser.add_argument("--output", default="benchmark_results.json", help="where the results are written (JSON)")
+    parser.add_argument("--baseline", help="results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown before flagging")
+    parser.add_argument("--quick", action="store_true", help="smaller workloads, and no experiments")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.quick)
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2)
+    for name, result in results["results"].items():
+        print(name.ljust(50), "%.6g" % result["value"], result["unit"])
+    print("Results written to " + args.output)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = 0
+        for name, old, new, change, regressed in compare(results, baseline, args.tolerance):
+            regressions += regressed
+            print(name.ljust(50), "%.6g -> %.6g (%+.1f%%)" % (old, new, 100 * change),
+                  "REGRESSION" if regressed else "")
+        print(str(regressions) + " regression(s) beyond " + str(int(100 * args.tolerance)) + "%")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Cache - Results of the experiments memoized on disk, keyed by everything that determines them
+A key is the SHA-256 of the experiment name, its parameters (integrator, timestep, ...) and the digest of the
+scenario contents, so a result is found again whichever file the same bodies were read from
+Every entry is one JSON file. Reading an entry marks it as used (its modification time), and the least recently
+used entries are removed once the directory grows past max_bytes
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+
+
+MISSING = object()
+
+
+def to_json(value):
+    """ The value with numpy arrays and numbers turned into lists and Python numbers, and tuples into lists """
+    if isinstance(value, dict):
+        return {str(key): to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return to_json(value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class ResultCache:
+    def __init__(self, directory=".orbital_cache", max_bytes=64 * 2 ** 20, enabled=True):
+        """ enabled=False finds nothing and stores nothing, so every result is computed """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        if enabled:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(experiment, params, scenario=None):
+        """ scenario: a Scenario, whose contents (not its file name) are part of the key """
+        description = {"experiment": experiment, "params": to_json(params),
+                       "scenario": None if scenario is None else scenario.digest()}
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key, default=MISSING):
+        """ The stored value, or default when there is none (or the entry cannot be read) """
+        path = self.path(key)
+        if not self.enabled:
+            self.misses += 1
+            return default
+        try:
+            with open(path) as entry:
+                value = json.load(entry)["value"]
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """ Writes the entry through a temporary file like Snapshot.save, then evicts the least recently used """
+        value = to_json(value)
+        if not self.enabled:
+            return value
+        path = self.path(key)
+        temp_path = path + "." + str(os.getpid()) + ".tmp"
+        with open(temp_path, "w") as entry:
+            json.dump({"value": value}, entry)
+        os.replace(temp_path, path)
+        self.evict(keep=path)
+        return value
+
+    def memoize(self, experiment, params, scenario, function):
+        """ The cached result of function() for these parameters, calling it only when there is none """
+        key = self.key(experiment, params, scenario)
+        value = self.get(key)
+        if value is MISSING:
+            value = self.put(key, function())
+        return value
+
+    def entries(self):
+        """ (last used, size, path) of every entry, least recently used first """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:     # Evicted by another process in the meantime
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+        return sorted(entries)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        """ Removes the least recently used entries (never keep) until the cache fits in max_bytes """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
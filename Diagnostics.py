@@ -0,0 +1,101 @@
+"""
+Diagnostics - Total energy, linear momentum and angular momentum of a Solar simulation, cheap enough to watch the
+drift of a production run
+The functions work on (N, 2) states or on (frames, N, 2) stacks of them, e.g. the positions of a recorded Trajectory
+"""
+
+import numpy as np
+
+
+def kinetic_energy(masses, velocities):
+    return 0.5 * np.einsum("i,...ij,...ij->...", masses, velocities, velocities)
+
+
+def potential_energy(G, masses, positions, accels=None):
+    """
+    The pairwise sum -G * m_i * m_j / r_ij over all pairs of planets
+    With the accelerations of the planets (from the planets alone) it is sum(m_i * r_i . a_i) instead, which is the
+    same sum for inverse-square forces but costs O(N) rather than O(N^2)
+    """
+    if accels is not None:
+        return np.einsum("i,...ij,...ij->...", masses, positions, accels)
+    disp = positions[..., np.newaxis, :, :] - positions[..., :, np.newaxis, :]
+    dist = np.sqrt(np.einsum("...k,...k->...", disp, disp))
+    inverse = np.divide(1, dist, out=np.zeros_like(dist), where=dist > 0)
+    return -0.5 * G * np.einsum("i,j,...ij->...", masses, masses, inverse)
+
+
+def linear_momentum(masses, velocities):
+    return np.einsum("i,...ij->...j", masses, velocities)
+
+
+def angular_momentum(masses, positions, velocities):
+    """ The z component about the origin """
+    return np.einsum("i,...i->...", masses,
+                     positions[..., 0] * velocities[..., 1] - positions[..., 1] * velocities[..., 0])
+
+
+class Diagnostics:
+    """
+    A Solar hook that samples the conserved quantities every `every` steps into preallocated buffers
+    (doubled when full), using only the planets since test particles are massless
+    """
+    def __init__(self, every=10, capacity=1024, pairwise=False):
+        """ pairwise: the O(N^2) potential energy, e.g. when the force backend is the approximate Barnes-Hut """
+        self.every = every
+        self.pairwise = pairwise
+        self.steps = 0
+        self.count = 0
+        self.times = np.zeros(capacity)
+        self.energy = np.zeros(capacity)
+        self.momentum = np.zeros((capacity, 2))
+        self.angular_momentum = np.zeros(capacity)
+        self.names = []
+        self.indices = {}
+
+    def attach(self, solar):
+        """ Samples the current state, then every `every` steps of the Solar """
+        self.names = solar.names.tolist()
+        self.indices = dict(solar.indices)
+        self.sample(solar)
+        solar.add_hook(self)
+        return self
+
+    def __call__(self, solar):
+        self.steps += 1
+        if self.steps % self.every == 0:
+            self.sample(solar)
+
+    def index(self, name):
+        return self.indices[name]
+
+    def sample(self, solar):
+        if self.count == len(self.times):
+            for name in ("times", "energy", "momentum", "angular_momentum"):
+                old = getattr(self, name)
+                new = np.zeros((2 * len(old),) + old.shape[1:])
+                new[:len(old)] = old
+                setattr(self, name, new)
+        n = solar.n_massive
+        masses, positions, velocities = solar.masses, solar.positions[:n], solar.velocities[:n]
+        accels = None if self.pairwise else solar.current_accels[:n]
+        self.times[self.count] = solar.time_passed
+        self.energy[self.count] = kinetic_energy(masses, velocities) + \
+            potential_energy(solar.G, masses, positions, accels)
+        self.momentum[self.count] = linear_momentum(masses, velocities)
+        self.angular_momentum[self.count] = angular_momentum(masses, positions, velocities)
+        self.count += 1
+
+    def drift(self, quantity="energy"):
+        """
+        The change of the energy or angular momentum since the first sample relative to its first value, or the size
+        of the change of the momentum (kg m/s), which usually starts at zero
+        """
+        values = getattr(self, quantity)[:self.count]
+        if quantity == "momentum":
+            return np.linalg.norm(values - values[0], axis=-1)
+        return (values - values[0]) / abs(values[0])
+
+    def summary(self):
+        return {"times": self.times[:self.count], "energy": self.energy[:self.count],
+                "momentum": self.momentum[:self.count], "angular_momentum": self.angular_momentum[:self.count]}
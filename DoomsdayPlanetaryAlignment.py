@@ -4,16 +4,35 @@ DoomsdayPlanetaryAlignment - Additional Experiment 2: Checks when planets will a
 
 from Solar import Solar
 from OrbitalPeriod import OrbitalPeriod
+from Events import angular_spread
 import numpy as np
 import math
 
 
 class DoomsdayPlanetaryAlignment:
 
-    def __init__(self, threshold=60):
-        self.solar = Solar()
-        self.orbit = OrbitalPeriod()    # For the calc_orbital_period function
+    def __init__(self, threshold=60, integrator="beeman", timestep=100000, margin=10, horizon=31557600, scenario=None,
+                 log_path="doomsday_alignment.txt"):
+        """
+        integrator: any name from Integrators.INTEGRATORS, e.g. "wisdom-holman" stays accurate at large timesteps
+        margin: degrees added to the threshold when predicting the alignment windows from the mean motions
+        horizon: seconds ahead the mean motions are trusted for, before they start again from the simulated positions
+        scenario: a Scenario or scenario file instead of input_params.txt
+        log_path: the text file the results are appended to (and printed), None keeps them quiet
+        """
+        self.solar = Solar(timestep=timestep, integrator=integrator, scenario=scenario)
+        self.orbit = OrbitalPeriod(scenario)    # For the calc_orbital_period function
+        self.log_path = log_path
         self.threshold = threshold
+        self.margin = margin
+        self.horizon = horizon
+        # Mean motions (radians per second) of the planets in the initial state, in the order of the state arrays
+        sun = self.solar.get_planet("Sun")
+        self.mean_motions = np.array([self.orbit.calc_mean_motion(planet, sun) for planet in self.solar.planets])
+
+    def calc_earth_year(self):
+        """ The orbital period of Earth in the initial state of the scenario """
+        return self.orbit.calc_orbital_period(self.solar.scenario.planet("Earth", self.solar.G))
 
     def get_angle_between_planets(self, p1, p2):
         """ Lecture Slides 7, Page 20, Approach 2 """
@@ -23,43 +42,126 @@ class DoomsdayPlanetaryAlignment:
         angle = math.acos((np.dot(sun_p1_vec, sun_p2_vec)) / (np.linalg.norm(sun_p1_vec) * np.linalg.norm(sun_p2_vec)))
         return angle
 
+    def longitudes(self):
+        """ The heliocentric longitudes of all planets but the Sun, and their rows in the state arrays """
+        sun = self.solar.index("Sun")
+        rows = np.flatnonzero(np.arange(self.solar.n_massive) != sun)
+        s = self.solar.positions[rows] - self.solar.positions[sun]
+        return np.arctan2(s[:, 1], s[:, 0]), rows
+
+    def alignment_spread(self):
+        """ The smallest arc around the Sun (radians) that contains all the planets """
+        return angular_spread(self.longitudes()[0])
+
     def planets_aligned(self):
-        """ Checks when the planets are aligned within some threshold """
-        planets_aligned = False
-        for p1 in self.solar.planets:
-            if (p1.name == "Sun"):  # Ignore the sun
-                continue
-            for p2 in self.solar.planets:
-                # Ignore the sun or if the p1 and p2 are the same planets
-                if (p2.name == "Sun" or p1.name == p2.name):
+        """ Checks when the planets are aligned within some threshold (every pair is within the threshold) """
+        return bool(self.alignment_spread() < (self.threshold * math.pi / 180))
+
+    def predict_window(self, threshold=None):
+        """
+        The next (start, end) time around which the planets, moving at their mean motions from where they are now,
+        come within the threshold (default self.threshold) plus the margin, or None if they do not within the horizon
+        """
+        threshold = self.threshold if threshold is None else threshold
+        longitudes, rows = self.longitudes()
+        motions = self.mean_motions[rows]
+        resolution = 2 * math.pi / np.max(motions) / 100
+        times = np.arange(0, self.horizon + resolution, resolution)
+        inside = angular_spread(longitudes + np.outer(times, motions)) < (threshold + self.margin) * math.pi / 180
+        entries = np.flatnonzero(inside)
+        if not len(entries):
+            return None
+        exits = np.flatnonzero(~inside[entries[0]:])
+        end = times[entries[0] + exits[0]] if len(exits) else times[-1]
+        return self.solar.time_passed + times[entries[0]] - resolution, self.solar.time_passed + end
+
+    def alignment_time_from_trajectory(self, trajectory, chunk_frames=65536):
+        """
+        The same search as write_alignment_year on the frames of a recorded Trajectory, a chunk at a time
+        Returns None if the planets do not align again within the recording
+        """
+        sun = trajectory.index("Sun")
+        planets = [i for i in range(trajectory.n_massive) if i != sun]
+        threshold = self.threshold * math.pi / 180
+        left_at = None
+        for start in range(0, len(trajectory), chunk_frames):
+            s = trajectory.positions[start:start + chunk_frames, planets] - \
+                trajectory.positions[start:start + chunk_frames, sun:sun + 1]
+            aligned = angular_spread(np.arctan2(s[..., 1], s[..., 0])) < threshold
+            if left_at is None:
+                left = np.flatnonzero(~aligned)
+                if not len(left):
                     continue
-                else:
-                    if self.get_angle_between_planets(p1, p2) < (self.threshold * math.pi / 180):
-                        # print("Angle between " + p1.name + " and " + p2.name + " is " + str(angle_between))
-                        planets_aligned = True
-                    else:
-                        return False
-        return planets_aligned
-
-    def write_alignment_year(self):
+                left_at = trajectory.times[start + left[0]]
+                aligned[:left[0]] = False
+            again = np.flatnonzero(aligned)
+            if len(again):
+                return trajectory.times[start + again[0]] - left_at
+        return None
+
+    def write_alignment_years(self, thresholds):
         """
-        Since they start off aligned, run until they are no longer aligned within the threshold
-        Then, start counting the years needed for them to align within the threshold again
+        write_alignment_year for several thresholds in one simulation: every step compares one angular spread with
+        all the thresholds, and each result is written as soon as its threshold is reached again
+        Until every threshold has been left the alignment is checked every step, after that only in the windows
+        predicted for the largest threshold still pending, as the windows of smaller thresholds lie inside them
         """
-        self.new_solar = Solar()
-        one_earth_year = self.orbit.calc_orbital_period(self.new_solar.get_planet("Earth"))
-        while self.planets_aligned():
-            self.solar.run_sim()
-        self.solar.time_passed = 0
+        one_earth_year = self.calc_earth_year()
+        thresholds = list(thresholds)
+        limits = np.array(thresholds, dtype=float) * math.pi / 180
+        left_at = np.full(len(thresholds), np.nan)
+        pending = np.ones(len(thresholds), dtype=bool)
+        results = {}
+
+        def check():
+            with self.solar.phase("alignment check"):
+                spread = self.alignment_spread()
+                leaving = np.isnan(left_at) & (spread >= limits)
+                left_at[leaving] = self.solar.time_passed
+                reached = pending & ~np.isnan(left_at) & ~leaving & (spread < limits)
+                for i in np.flatnonzero(reached):
+                    results[i] = self._write_alignment(thresholds[i],
+                                                       (self.solar.time_passed - left_at[i]) / one_earth_year)
+                pending[reached] = False
 
-        while not self.planets_aligned():
+        check()
+        while pending.any() and np.isnan(left_at).any():
             self.solar.run_sim()
+            check()
 
-        alignment_time = self.solar.time_passed / one_earth_year
-        doomsday_msg = "The planets aligned within " + str(self.threshold) + " degrees after " + \
-                       str(alignment_time) + " years.\n"
-        print(doomsday_msg)
-        with open("doomsday_alignment.txt", "a") as myTxt:
-            myTxt.write(doomsday_msg)
-        return (int(self.threshold), alignment_time)
+        # Coarse to fine: the simulation only checks the alignment in the windows the mean motions predict
+        while pending.any():
+            with self.solar.phase("window prediction"):
+                window = self.predict_window(max(threshold for threshold, p in zip(thresholds, pending) if p))
+            start, end = window if window is not None else (self.solar.time_passed + self.horizon,) * 2
+            while self.solar.time_passed < start:
+                self.solar.run_sim()
+            while pending.any() and self.solar.time_passed <= end:
+                self.solar.run_sim()
+                check()
+        return [results[i] for i in range(len(thresholds))]
 
+    def _write_alignment(self, threshold, alignment_time):
+        if self.log_path is not None:
+            doomsday_msg = "The planets aligned within " + str(threshold) + " degrees after " + \
+                           str(alignment_time) + " years.\n"
+            print(doomsday_msg)
+            with open(self.log_path, "a") as myTxt:
+                myTxt.write(doomsday_msg)
+        return (int(threshold), alignment_time)
+
+    def write_alignment_year(self, trajectory=None):
+        """
+        Since they start off aligned, run until they are no longer aligned within the threshold
+        Then, start counting the years needed for them to align within the threshold again, predicting the windows
+        where that can happen from the mean motions of the planets and only checking the alignment inside them
+        trajectory: searches a recorded Trajectory instead of running the simulation
+        """
+        if trajectory is None:
+            return self.write_alignment_years([self.threshold])[0]
+        one_earth_year = self.calc_earth_year()
+        time_passed = self.alignment_time_from_trajectory(trajectory)
+        if time_passed is None:
+            raise ValueError("The planets do not align within " + str(self.threshold) +
+                             " degrees in the recorded trajectory")
+        return self._write_alignment(self.threshold, time_passed / one_earth_year)
@@ -1,43 +1,62 @@
 """
-EnergyConservation - Plots a graph that shows the total energy in the solar system (Beeman / Direct Euler)
+EnergyConservation - Plots a graph that shows the total energy in the solar system (for any registered integrator)
 """
 
-from Solar import Solar, SolarEuler
+from Solar import Solar
+from Diagnostics import Diagnostics, kinetic_energy, potential_energy
 import numpy as np
 import matplotlib.pyplot as plt
 
 
 class EnergyConservation:
-    def __init__(self, euler=False):
-        """ Initialises a Solar system and an array that holds the energy data """
+    def __init__(self, euler=False, adaptive=False, tolerance=1e-10, integrator=None, timestep=100000, scenario=None):
+        """
+        Initialises a Solar system and an array that holds the energy data
+        integrator: any name from Integrators.INTEGRATORS, euler=True and adaptive=True are kept as shorthands
+        scenario: a Scenario or scenario file instead of input_params.txt
+        """
         self.euler = euler
-        if self.euler:
-            self.solar = SolarEuler()
-        else:
-            self.solar = Solar()
+        options = {}
+        if integrator is None:
+            integrator = "euler" if euler else ("dopri5" if adaptive else "beeman")
+        if integrator in ("dopri5", "adaptive"):
+            options["tolerance"] = tolerance
+        self.solar = Solar(timestep=timestep, integrator=integrator, scenario=scenario, **options)
         self.energies = []
+        self.diagnostics = Diagnostics()
 
     def calc_total_energy(self):
-        """ Calculates the Total Gravitational Potential Energy in the system """
-        te = 0
-        for planet in self.solar.planets:
-            # Kinetic Energy: 1/2 * planet_mass * planet_velocity^2
-            ke = (1 / 2) * planet.mass * (np.linalg.norm(planet.velo) ** 2)
-            # Potential Energy: -1 * planet_mass * planet_acceleration * distance_of_planet_from_sun
-            pe = -planet.mass * (np.linalg.norm(self.solar.calc_force(planet)) / planet.mass) * \
-                 np.linalg.norm(planet.pos - self.solar.get_planet("Sun").pos)
-            te += (ke + pe)
-        self.energies.append(te)
+        """ Calculates the Total Energy (kinetic plus pairwise gravitational potential) in the system """
+        with self.solar.phase("energy"):
+            self.diagnostics.sample(self.solar)
+        self.energies.append(self.diagnostics.energy[self.diagnostics.count - 1])
+
+    @staticmethod
+    def energies_from_trajectory(trajectory, chunk_frames=1024):
+        """ calc_total_energy for every frame of a recorded Trajectory, a chunk of frames at a time """
+        n = trajectory.n_massive
+        energies = np.zeros(len(trajectory))
+        for start in range(0, len(trajectory), chunk_frames):
+            positions = trajectory.positions[start:start + chunk_frames, :n]
+            velocities = trajectory.velocities[start:start + chunk_frames, :n]
+            energies[start:start + chunk_frames] = kinetic_energy(trajectory.masses, velocities) + \
+                potential_energy(trajectory.G, trajectory.masses, positions)
+        return energies
 
-    def run(self):
-        if self.euler:
+    def run(self, trajectory=None):
+        """ trajectory: plots the energies of a recorded Trajectory instead of running the simulation """
+        if trajectory is not None:
+            self.energies = list(self.energies_from_trajectory(trajectory))
+            limit = len(self.energies)
+        elif self.euler:
             limit = 5000
         else:
             limit = 500
         while (len(self.energies) < limit):
             self.solar.run_sim()
             self.calc_total_energy()
-        plt.plot(self.energies)
+        with self.solar.phase("plot"):
+            plt.plot(self.energies)
         plt.xlabel("Timesteps")
         plt.ylabel("Total Energy (J)")
         plt.title("Total Energy in the Simulation")
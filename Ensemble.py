@@ -0,0 +1,172 @@
+"""
+Ensemble - Many perturbed copies of a Solar system advanced together as one (M, N, 2) batch
+Used for Monte Carlo studies of how sensitive results (alignment years, miss distances) are to the initial
+conditions and masses. Statistics are aggregated on the fly while the members are stepped.
+"""
+
+from Integrators import make_integrator
+import numpy as np
+
+
+class SampleStatistic:
+    """ The mean, standard deviation, min and max across the members every time it is sampled """
+    def __init__(self, function):
+        self.function = function
+        self.times, self.mean, self.std, self.min, self.max = [], [], [], [], []
+
+    def update(self, time, values):
+        self.times.append(time)
+        self.mean.append(float(np.mean(values)))
+        self.std.append(float(np.std(values)))
+        self.min.append(float(np.min(values)))
+        self.max.append(float(np.max(values)))
+
+    def summary(self):
+        return {"times": np.array(self.times), "mean": np.array(self.mean), "std": np.array(self.std),
+                "min": np.array(self.min), "max": np.array(self.max)}
+
+
+class RunningMinimum:
+    """ The smallest value of every member so far, and when it happened (e.g. miss distances) """
+    def __init__(self, function):
+        self.function = function
+        self.values = None
+        self.times = None
+
+    def update(self, time, values):
+        if self.values is None:
+            self.values = np.full(len(values), np.inf)
+            self.times = np.full(len(values), np.nan)
+        smaller = values < self.values
+        self.values[smaller] = values[smaller]
+        self.times[smaller] = time
+
+    def summary(self):
+        return {"values": self.values, "times": self.times, "mean": float(np.mean(self.values)),
+                "std": float(np.std(self.values))}
+
+
+class FirstTime:
+    """ The first time a condition became true for every member (NaN while it has not), e.g. alignment years """
+    def __init__(self, function):
+        self.function = function
+        self.times = None
+
+    def update(self, time, values):
+        if self.times is None:
+            self.times = np.full(len(values), np.nan)
+        self.times[np.isnan(self.times) & values] = time
+
+    def summary(self):
+        reached = self.times[~np.isnan(self.times)]
+        return {"times": self.times, "reached": len(reached),
+                "mean": float(np.mean(reached)) if len(reached) else np.nan,
+                "std": float(np.std(reached)) if len(reached) else np.nan}
+
+
+class Ensemble:
+    def __init__(self, base, members=100, perturbation=None, timestep=None, integrator="beeman", seed=None,
+                 **options):
+        """
+        base: a Solar or Snapshot that every member starts from
+        perturbation: Gaussian noise for "position" (m), "velocity" (m/s) and "mass" (relative), each either one
+                      sigma for all planets or a {planet name: sigma} dict, e.g. {"mass": {"Jupiter": 1e-3}}
+        integrator: any name from Integrators.INTEGRATORS that works on plain arrays (not "wisdom-holman" or "block")
+        """
+        snapshot = base.snapshot() if hasattr(base, "snapshot") else base
+        perturbation = perturbation or {}
+        rng = np.random.default_rng(seed)
+        self.G = snapshot.G
+        self.names = snapshot.names
+        self.n_massive = snapshot.n_massive
+        self.members = members
+        self.timestep = snapshot.timestep if timestep is None else timestep
+        self.time_passed = snapshot.time_passed
+        self.force_evaluations = 0
+
+        n = self.n_massive
+        self.masses = np.tile(snapshot.masses, (members, 1))
+        self.positions = np.tile(snapshot.positions, (members, 1, 1))
+        self.velocities = np.tile(snapshot.velocities, (members, 1, 1))
+        self.masses *= 1 + self._sigmas(perturbation.get("mass", 0), n) * rng.standard_normal((members, n))
+        self.positions[:, :n] += self._sigmas(perturbation.get("position", 0), n)[:, np.newaxis] * \
+            rng.standard_normal((members, n, 2))
+        self.velocities[:, :n] += self._sigmas(perturbation.get("velocity", 0), n)[:, np.newaxis] * \
+            rng.standard_normal((members, n, 2))
+        # Unperturbed members continue exactly like the snapshot, previous_accels included (Beeman needs it)
+        self.current_accels = np.tile(snapshot.current_accels, (members, 1, 1))
+        self.previous_accels = np.tile(snapshot.previous_accels, (members, 1, 1))
+        perturbed = np.any(self.masses != snapshot.masses, axis=1) | \
+            np.any(self.positions != snapshot.positions, axis=(1, 2))
+
+        if integrator in ("wisdom-holman", "wh"):
+            raise ValueError("The ensemble cannot use the Wisdom-Holman integrator")
+        if integrator in ("block", "block-timesteps"):
+            raise ValueError("The ensemble cannot use block timesteps, the members would need different levels")
+        self.integrator = make_integrator(integrator, **options)
+        self.integrator.resize(self.positions.shape)
+        shape = (members, len(snapshot.positions), n)
+        self._gm = self.G * self.masses
+        self._disp = np.zeros(shape + (2,))
+        self._dist = np.zeros(shape)
+        self._weights = np.zeros(shape)
+        self._mask = np.zeros(shape, dtype=bool)
+        if np.any(perturbed):   # Start over from their new state, like a Solar with a new set of planets
+            accels = self.calc_accels(self.positions, np.zeros_like(self.positions))
+            self.current_accels[perturbed] = accels[perturbed]
+            self.previous_accels[perturbed] = accels[perturbed]
+        self.statistics = {}
+
+    def _sigmas(self, sigma, n):
+        """ One sigma for every planet, from a single value or a {planet name: sigma} dict """
+        if isinstance(sigma, dict):
+            return np.array([sigma.get(name, 0.0) for name in self.names[:n]])
+        return np.full(n, float(sigma))
+
+    def index(self, name):
+        return self.names.index(name)
+
+    def calc_accels(self, positions, out):
+        """ The accelerations of every body in every member, all pairs of all members in one batched pass """
+        self.force_evaluations += 1
+        disp, dist, weights, mask = self._disp, self._dist, self._weights, self._mask
+        sources = positions[:, :self.n_massive]
+        np.subtract(sources[:, np.newaxis, :, :], positions[:, :, np.newaxis, :], out=disp)
+        np.einsum("mijk,mijk->mij", disp, disp, out=dist)
+        np.greater(dist, 0, out=mask)
+        np.sqrt(dist, out=weights)
+        np.multiply(dist, weights, out=dist)
+        weights.fill(0)
+        np.divide(self._gm[:, np.newaxis, :], dist, out=weights, where=mask)
+        np.einsum("mij,mijk->mik", weights, disp, out=out)
+        return out
+
+    def longitudes(self, bodies, centre=0):
+        """ (M, len(bodies)) angles of the given bodies around the centre body in every member """
+        s = self.positions[:, bodies] - self.positions[:, centre:centre + 1]
+        return np.arctan2(s[..., 1], s[..., 0])
+
+    def distances(self, p1, p2):
+        """ (M,) distance between two bodies in every member """
+        return np.linalg.norm(self.positions[:, p1] - self.positions[:, p2], axis=-1)
+
+    def track(self, name, function, kind="sample"):
+        """
+        function(ensemble) returns one value per member, aggregated after every step as:
+        "sample" - mean / std / min / max across the members over time, "minimum" - the running minimum of every
+        member, "first" - the first time a (boolean) value became true for every member
+        """
+        trackers = {"sample": SampleStatistic, "minimum": RunningMinimum, "first": FirstTime}
+        self.statistics[name] = trackers[kind](function)
+
+    def run_sim(self):
+        self.time_passed += self.integrator.step(self, self.timestep)
+        for statistic in self.statistics.values():
+            statistic.update(self.time_passed, statistic.function(self))
+
+    def run_until(self, end_time):
+        while self.time_passed < end_time:
+            self.run_sim()
+
+    def summary(self):
+        return {name: statistic.summary() for name, statistic in self.statistics.items()}
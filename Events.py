@@ -0,0 +1,151 @@
+"""
+Events - Detects events in between the steps of a Solar simulation and refines their exact time and state
+An event function takes an EventState and returns a value, or an array of values (one for every candidate):
+    "crossing" events happen when a value changes sign, e.g. a phase angle minus its target
+    "minimum" events happen when a value passes through a local minimum, e.g. the distance between two bodies
+The state in between two steps comes from cubic Hermite interpolation of the positions and velocities
+"""
+
+from collections import namedtuple
+import numpy as np
+import math
+
+
+EventState = namedtuple("EventState", ["time", "positions", "velocities"])
+EventRecord = namedtuple("EventRecord", ["name", "index", "time", "value", "state"])
+
+GOLDEN_RATIO = (math.sqrt(5) - 1) / 2
+
+
+def interpolate_state(s0, s1, time):
+    """ Cubic Hermite interpolation between two states, using the rows both states have """
+    rows = min(len(s0.positions), len(s1.positions))
+    h = s1.time - s0.time
+    s = (time - s0.time) / h
+    p0, v0, p1, v1 = s0.positions[:rows], s0.velocities[:rows], s1.positions[:rows], s1.velocities[:rows]
+    positions = (2 * s ** 3 - 3 * s ** 2 + 1) * p0 + (s ** 3 - 2 * s ** 2 + s) * h * v0 + \
+                (-2 * s ** 3 + 3 * s ** 2) * p1 + (s ** 3 - s ** 2) * h * v1
+    velocities = (6 * s ** 2 - 6 * s) * (p0 - p1) / h + (3 * s ** 2 - 4 * s + 1) * v0 + (3 * s ** 2 - 2 * s) * v1
+    return EventState(time, positions, velocities)
+
+
+def state_at(states, time):
+    """ Interpolates within the consecutive step states that bracket the given time """
+    for s0, s1 in zip(states[:-1], states[1:]):
+        if time <= s1.time:
+            return interpolate_state(s0, s1, time)
+    return interpolate_state(states[-2], states[-1], time)
+
+
+def angular_spread(longitudes):
+    """ The smallest arc (radians) that contains all the given angles, along the last axis """
+    ordered = np.sort(np.mod(longitudes, 2 * math.pi), axis=-1)
+    gaps = np.diff(ordered, axis=-1, append=ordered[..., :1] + 2 * math.pi)
+    return 2 * math.pi - np.max(gaps, axis=-1)
+
+
+def wrap_angle(angle):
+    """ Wraps an angle (or array of angles) to [-pi, pi) """
+    return (angle + math.pi) % (2 * math.pi) - math.pi
+
+
+def longitude(state, i, centre=0):
+    s = state.positions[i] - state.positions[centre]
+    return np.arctan2(s[..., 1], s[..., 0])
+
+
+def phase_angle_event(p1, p2, targets, centre=0, **kwargs):
+    """ Crosses zero when body p2 is the target angle(s) ahead of body p1 as seen from the centre body """
+    targets = np.asarray(targets, dtype=float)
+    return Event(lambda state: wrap_angle(longitude(state, p2, centre) - longitude(state, p1, centre) - targets),
+                 kind="crossing", period=2 * math.pi, **kwargs)
+
+
+def distance_minimum_event(p1, p2, **kwargs):
+    """ Closest approaches between body p1 and body p2 (or a slice of bodies, e.g. test particles) """
+    return Event(lambda state: np.linalg.norm(state.positions[p1] - state.positions[p2], axis=-1),
+                 kind="minimum", **kwargs)
+
+
+def alignment_event(bodies, threshold, centre=0, **kwargs):
+    """ Crosses zero when the bodies come within (falling) or leave (rising) an arc of threshold radians """
+    bodies = list(bodies)
+    return Event(lambda state: angular_spread(longitude(state, bodies, centre)) - threshold, kind="crossing", **kwargs)
+
+
+class Event:
+    def __init__(self, function, name="event", kind="crossing", direction=0, terminal=False, period=None,
+                 tolerance=1e-3):
+        """
+        direction: only rising (+1) or falling (-1) crossings, 0 for both; terminal: stops Solar.run_until
+        period: ignores jumps where a periodic value (e.g. a wrapped angle) wraps around; tolerance in seconds
+        """
+        if kind not in ("crossing", "minimum"):
+            raise ValueError("Unknown event kind: " + str(kind))
+        self.function = function
+        self.name = name
+        self.kind = kind
+        self.direction = direction
+        self.terminal = terminal
+        self.period = period
+        self.tolerance = tolerance
+        self.values = []    # The values at the last (up to) three steps
+
+    def value(self, state, index=None):
+        value = np.atleast_1d(self.function(state))
+        return value if index is None else value[index]
+
+    def check(self, states):
+        """ Called with the last (up to) three step states, newest last, and returns the events since the last step """
+        self.values = (self.values + [self.value(states[-1])])[-3:]
+        if self.kind == "crossing" and len(self.values) >= 2:
+            return self._crossings(states[-2:])
+        if self.kind == "minimum" and len(self.values) == 3:
+            return self._minima(states[-3:])
+        return []
+
+    def _crossings(self, states):
+        rows = min(len(self.values[-2]), len(self.values[-1]))
+        v0, v1 = self.values[-2][:rows], self.values[-1][:rows]
+        crossed = (v0 < 0) != (v1 < 0)
+        if self.direction > 0:
+            crossed &= (v0 < 0)
+        elif self.direction < 0:
+            crossed &= (v1 < 0)
+        if self.period is not None:
+            crossed &= (np.abs(v1 - v0) < self.period / 2)
+        records = []
+        for index in np.flatnonzero(crossed):
+            # Bisection on the interpolated state, keeping the sign change inside [lo, hi]
+            lo, hi = states[0].time, states[1].time
+            while hi - lo > self.tolerance:
+                mid = (lo + hi) / 2
+                if (self.value(interpolate_state(states[0], states[1], mid), index) < 0) == (v0[index] < 0):
+                    lo = mid
+                else:
+                    hi = mid
+            state = interpolate_state(states[0], states[1], (lo + hi) / 2)
+            records.append(EventRecord(self.name, int(index), state.time, self.value(state, index), state))
+        return records
+
+    def _minima(self, states):
+        rows = min(len(values) for values in self.values)
+        v0, v1, v2 = (values[:rows] for values in self.values)
+        records = []
+        for index in np.flatnonzero((v1 < v0) & (v1 <= v2)):
+            # Golden-section search over the two steps around the smallest sampled value
+            lo, hi = states[0].time, states[2].time
+            a, b = hi - GOLDEN_RATIO * (hi - lo), lo + GOLDEN_RATIO * (hi - lo)
+            fa, fb = self.value(state_at(states, a), index), self.value(state_at(states, b), index)
+            while hi - lo > self.tolerance:
+                if fa < fb:
+                    hi, b, fb = b, a, fa
+                    a = hi - GOLDEN_RATIO * (hi - lo)
+                    fa = self.value(state_at(states, a), index)
+                else:
+                    lo, a, fa = a, b, fb
+                    b = lo + GOLDEN_RATIO * (hi - lo)
+                    fb = self.value(state_at(states, b), index)
+            state = state_at(states, (lo + hi) / 2)
+            records.append(EventRecord(self.name, int(index), state.time, self.value(state, index), state))
+        return records
@@ -0,0 +1,190 @@
+"""
+Forces - The force backends that calculate the gravitational accelerations for a Solar system
+DirectSummation - The exact pairwise sum, O(N^2), used for small systems
+BarnesHut - A quadtree that approximates far away groups of planets by their centre of mass, O(N log N)
+"""
+
+import numpy as np
+
+
+DIRECT_SUMMATION_LIMIT = 2000   # Above this many planets "auto" switches to the Barnes-Hut tree
+
+
+class DirectSummation:
+    name = "direct"
+
+    def __init__(self):
+        self.gm = np.zeros(0)
+
+    def set_masses(self, gm, n_bodies=None):
+        """
+        Takes G * mass of the N planets that pull on the others and allocates the (N + K, N) workspaces for the
+        pairwise pass, where the K bodies after the planets are massless test particles
+        """
+        n = len(gm)
+        n_bodies = n if n_bodies is None else n_bodies
+        self.gm = gm
+        self._disp = np.zeros((n_bodies, n, 2))
+        self._dist = np.zeros((n_bodies, n))
+        self._weights = np.zeros((n_bodies, n))
+        self._mask = np.zeros((n_bodies, n), dtype=bool)
+
+    def accelerations(self, positions, out, targets=None):
+        """
+        Calculates the accelerations of every body caused by all planets in one batched pass
+        targets: only these rows of out are calculated (the other rows are left as they are)
+        """
+        bodies = positions if targets is None else positions[targets]
+        m = len(bodies)
+        disp, dist, weights, mask = self._disp[:m], self._dist[:m], self._weights[:m], self._mask[:m]
+        sources = positions[:len(self.gm)]
+        np.subtract(sources[np.newaxis, :, :], bodies[:, np.newaxis, :], out=disp)  # disp[i, j] = pos_j - pos_i
+        np.einsum("ijk,ijk->ij", disp, disp, out=dist)
+        np.greater(dist, 0, out=mask)  # A planet exerts no force on itself (or on another planet at the same spot)
+        np.sqrt(dist, out=weights)
+        np.multiply(dist, weights, out=dist)  # |s| ** 3
+        weights.fill(0)
+        np.divide(self.gm, dist, out=weights, where=mask)
+        if targets is None:
+            np.einsum("ij,ijk->ik", weights, disp, out=out)
+        else:
+            out[targets] = np.einsum("ij,ijk->ik", weights, disp)
+        return out
+
+
+class BarnesHut:
+    """
+    The quadtree is built level by level from the integer grid coordinates of the planets, so every level is a
+    handful of array operations instead of one Python object per node. The tree is then walked by all planets at
+    once: a (planet, cell) pair is accepted when cell_size / distance < theta, otherwise the cell is opened.
+    Only the planets go into the tree, massless test particles after them just walk it.
+    """
+    name = "barnes-hut"
+
+    def __init__(self, theta=0.5, max_depth=20, chunk_size=4096):
+        self.theta = theta
+        self.max_depth = max_depth
+        self.chunk_size = chunk_size
+        self.gm = np.zeros(0)
+        self._body_gm = np.zeros(0)
+
+    def set_masses(self, gm, n_bodies=None):
+        n_bodies = len(gm) if n_bodies is None else n_bodies
+        self.gm = gm
+        self._body_gm = np.zeros(n_bodies)   # Test particles have no mass of their own to remove from a leaf
+        self._body_gm[:len(gm)] = gm
+
+    def build_tree(self, positions):
+        """
+        Returns the cells of every level: their keys, total G * mass, centre of mass, number of planets, the key of
+        every planet at that level, the cell size and the indices of the children on the next level
+        """
+        n_sources = len(self.gm)
+        lo = positions.min(axis=0)
+        width = max(float(np.max(positions.max(axis=0) - lo)), 1.0) * (1 + 1e-9)
+        cells_per_side = 2 ** self.max_depth
+        grid = np.floor((positions - lo) / width * cells_per_side).astype(np.int64)
+        np.clip(grid, 0, cells_per_side - 1, out=grid)
+
+        levels = []
+        for level in range(self.max_depth + 1):
+            shift = self.max_depth - level
+            keys = ((grid[:, 0] >> shift) << level) | (grid[:, 1] >> shift)
+            cell_keys, cell_of, counts = np.unique(keys[:n_sources], return_inverse=True, return_counts=True)
+            mass = np.bincount(cell_of, weights=self.gm, minlength=len(cell_keys))
+            com = np.zeros((len(cell_keys), 2))
+            for k in range(2):
+                com[:, k] = np.bincount(cell_of, weights=self.gm * positions[:n_sources, k], minlength=len(cell_keys))
+            np.divide(com, mass[:, np.newaxis], out=com, where=mass[:, np.newaxis] > 0)
+            levels.append([cell_keys, mass, com, counts, keys, width / (2 ** level), None])
+            if level > 0:
+                # Links every cell to its parent's row of four children (-1 where a quadrant is empty)
+                parent_cell_keys = levels[level - 1][0]
+                child_x, child_y = cell_keys >> level, cell_keys & ((1 << level) - 1)
+                parent = np.searchsorted(parent_cell_keys, ((child_x >> 1) << (level - 1)) | (child_y >> 1))
+                children = np.full((len(parent_cell_keys), 4), -1, dtype=np.int64)
+                children[parent, 2 * (child_x & 1) + (child_y & 1)] = np.arange(len(cell_keys))
+                levels[level - 1][6] = children
+            if np.all(counts == 1):     # Every planet has its own cell, so there is nothing left to split
+                break
+        return levels
+
+    def accelerations(self, positions, out, targets=None):
+        """ targets: only these rows of out are calculated, like DirectSummation """
+        levels = self.build_tree(positions)
+        targets = np.arange(len(positions)) if targets is None else np.asarray(targets)
+        out[targets] = 0
+        for start in range(0, len(targets), self.chunk_size):
+            self._walk(levels, positions, targets[start:start + self.chunk_size], out)
+        return out
+
+    def _walk(self, levels, positions, targets, out):
+        """ Walks the tree for a chunk of planets, one level at a time """
+        tgt = targets
+        cell = np.zeros(len(targets), dtype=np.int64)
+        theta_squared = self.theta ** 2
+        for level, (cell_keys, mass, com, counts, keys, size, children) in enumerate(levels):
+            last_level = (level == len(levels) - 1)
+            s = com[cell] - positions[tgt]
+            mag_squared = np.einsum("ij,ij->i", s, s)
+            contains_self = (keys[tgt] == cell_keys[cell])
+            accept = ~contains_self & (size * size < theta_squared * mag_squared)
+            leaf = (counts[cell] == 1) | last_level
+            use = accept | leaf
+            m = mass[cell]
+
+            # A leaf holding the planet itself only pulls with what is left after removing that planet
+            own = use & contains_self
+            if np.any(own):
+                own_gm = self._body_gm[tgt[own]]
+                remaining = m[own] - own_gm
+                weighted = com[cell[own]] * m[own][:, np.newaxis] - positions[tgt[own]] * own_gm[:, np.newaxis]
+                shifted = np.zeros_like(weighted)
+                np.divide(weighted, remaining[:, np.newaxis], out=shifted, where=remaining[:, np.newaxis] > 0)
+                m[own] = np.where(remaining > 0, remaining, 0)
+                s[own] = shifted - positions[tgt[own]]
+                mag_squared[own] = np.einsum("ij,ij->i", s[own], s[own])
+
+            pull = use & (mag_squared > 0) & (m > 0)
+            weights = m[pull] / (mag_squared[pull] * np.sqrt(mag_squared[pull]))
+            for k in range(2):
+                out[:, k] += np.bincount(tgt[pull], weights=weights * s[pull, k], minlength=len(out))
+
+            # Open every cell that was neither accepted nor a leaf
+            opened = ~use
+            if last_level or not np.any(opened):
+                break
+            child = children[cell[opened]]
+            exists = (child >= 0)
+            tgt = np.repeat(tgt[opened], 4).reshape(-1, 4)[exists]
+            cell = child[exists]
+
+    def error_estimate(self, positions, sample=256, seed=0):
+        """ Compares the tree accelerations with direct summation for a random sample of bodies """
+        tree = self.accelerations(positions, np.zeros_like(positions))
+        rng = np.random.default_rng(seed)
+        chosen = rng.choice(len(positions), size=min(sample, len(positions)), replace=False)
+        exact = np.zeros((len(chosen), 2))
+        for row, i in enumerate(chosen):
+            s = positions[:len(self.gm)] - positions[i]
+            mag_squared = np.einsum("ij,ij->i", s, s)
+            mag_squared[mag_squared == 0] = np.inf
+            exact[row] = np.einsum("i,ij->j", self.gm / (mag_squared ** 1.5), s)
+        exact_norm = np.linalg.norm(exact, axis=1)
+        relative = np.linalg.norm(tree[chosen] - exact, axis=1) / np.where(exact_norm > 0, exact_norm, 1)
+        return {"theta": self.theta, "sample": len(chosen), "median": float(np.median(relative)),
+                "p99": float(np.percentile(relative, 99)), "max": float(np.max(relative))}
+
+
+FORCE_BACKENDS = {DirectSummation.name: DirectSummation, BarnesHut.name: BarnesHut}
+
+
+def make_force_backend(force, n, theta=0.5):
+    """ "auto" keeps the exact pairwise sum for small systems and uses the tree for large catalogs """
+    if force == "auto":
+        force = DirectSummation.name if n <= DIRECT_SUMMATION_LIMIT else BarnesHut.name
+    if force not in FORCE_BACKENDS:
+        raise ValueError("Unknown force backend: " + str(force) + " (choose from " + ", ".join(FORCE_BACKENDS) + ")")
+    if force == BarnesHut.name:
+        return BarnesHut(theta=theta)
+    return DirectSummation()
@@ -3,22 +3,41 @@ Hohmann - Calculates the best angle and initial velocity to launch a satellite t
           and returns the closest distance between the satellite and Mars for a given launch angle
 """
 
-from Solar import Solar
-from Planet import Planet
+from Solar import Solar, SolarAdaptive
 from OrbitalPeriod import OrbitalPeriod
+from Events import phase_angle_event, distance_minimum_event, wrap_angle
+from Kepler import kepler_ephemeris
+from Lambert import KeplerEphemeris, porkchop_sweep, best_windows, check_window
 import numpy as np
 import math
 
 
 class Hohmann:
-    def __init__(self):
-        self.solar = Solar(timestep=1000)
-        self.solar.planets = self.solar.planets[:-1]    # Removes Jupiter
-        self.orbit = OrbitalPeriod()
+    def __init__(self, snapshot=None, timestep=1000, adaptive=False, tolerance=1e-10, kepler=False, scenario=None,
+                 integrator=None):
+        """
+        snapshot: continues from a warm_up() snapshot so a sweep pays for the first two years only once
+        timestep: launches and closest approaches are refined in between steps, but the integrator error still grows
+                  with it: with Beeman the closest distances are off by up to 0.4% at 1000s, 2% at 5000s and 7% at
+                  20000s. Only adaptive=True or integrator="block" keep them within 1% at longer steps (a day)
+        adaptive: uses SolarAdaptive, which takes large steps in the cruise and small ones near Mars
+        kepler: warm_up() jumps along the Kepler orbits instead of integrating the two years step by step
+        scenario: a Scenario or scenario file instead of input_params.txt
+        integrator: any name from Integrators.INTEGRATORS, e.g. "block" keeps the planets at long steps and only
+                    shortens them for the satellites that need it, so timestep can be a day
+        """
+        self.kepler = kepler
+        if adaptive:
+            self.solar = SolarAdaptive(timestep=timestep, tolerance=tolerance, snapshot=snapshot, scenario=scenario)
+        else:
+            self.solar = Solar(timestep=timestep, snapshot=snapshot, scenario=scenario, integrator=integrator)
+        if snapshot is None:
+            self.solar.planets = self.solar.planets[:-1]    # Removes Jupiter
+        # Otherwise Jupiter was already removed before the snapshot was taken
+        self.orbit = OrbitalPeriod(scenario)
         self.sun = self.solar.get_planet("Sun")
         self.earth = self.solar.get_planet("Earth")
         self.mars = self.solar.get_planet("Mars")
-        self.satellite = None
 
     def calc_semi_major_axis(self, p1, p2):
         return (1 / 2) * (np.linalg.norm(p1.pos - self.sun.pos) + np.linalg.norm(p2.pos - self.sun.pos))
@@ -29,43 +48,134 @@ class Hohmann:
     def calc_phase_angle(self, p1, p2):
         return (1 - 2 * ((self.calc_elliptical_orbit(p1, p2) / 2) / self.orbit.calc_orbital_period(p2))) * math.pi
 
+    def calc_transfer_speed(self, r1, r2):
+        return math.sqrt(2 * self.solar.G * self.sun.mass * (r2 / (r1 * (r1 + r2))))
+
     def calc_transfer_velo(self, p1, p2):
         r1 = np.linalg.norm(p1.pos - self.sun.pos)
         r2 = np.linalg.norm(p2.pos - self.sun.pos)
-        return math.sqrt(2 * self.solar.G * self.sun.mass * (r2 / (r1 * (r1 + r2)))) * (p1.velo / np.linalg.norm(p1.velo))
+        return self.calc_transfer_speed(r1, r2) * (p1.velo / np.linalg.norm(p1.velo))
 
     def calc_clockwise_angle(self, planet):
         sun_p_vec = planet.pos - self.sun.pos
         angle = math.atan2(sun_p_vec[1], sun_p_vec[0])
         return (2 * math.pi + angle) if angle < 0 else angle
 
-    def satellite_sim(self, angle):
-        """ Launches a Satellite (as a Planet object) from the given angle on Earth """
-        satellite_angle = round(angle + math.pi, 4)
-        while (self.solar.time_passed < 2 * self.orbit.calc_orbital_period(self.earth)):
-            self.solar.run_sim()
-        mars_angle = round(self.calc_clockwise_angle(self.mars) - self.calc_clockwise_angle(self.earth), 4)
-        while (satellite_angle != mars_angle):  # Rounding Error may cause issues
+    def warm_up(self):
+        """ Runs the two Earth years every launch search starts with, and returns a snapshot of the state after """
+        warm_up_time = 2 * self.orbit.calc_orbital_period(self.earth)
+        if self.kepler and self.solar.time_passed < warm_up_time:
+            self.solar.fast_forward(warm_up_time - self.solar.time_passed)
+        while (self.solar.time_passed < warm_up_time):
             self.solar.run_sim()
-            mars_angle = round(self.calc_clockwise_angle(self.mars) - self.calc_clockwise_angle(self.earth), 4)
+        return self.solar.snapshot()
 
-        # Initialise a Satellite as a Planet
-        satellite_pos = (-1) * self.earth.pos
-        satellite_velo = (-1) * self.calc_transfer_velo(self.earth, self.mars)
-        self.satellite = Planet(self.solar.G, "Satellite", 10000, satellite_pos, satellite_velo, 10, "green")
-        self.solar.planets.append(self.satellite)
+    def predict_launch_times(self, angles, span=None, resolution=86400):
+        """
+        The first time after now (s) that Mars is (angle + pi) ahead of Earth for each launch angle, from the Kepler
+        orbits of both planets, so launch epochs can be scanned without integrating. span defaults to one synodic period
+        """
+        angles = np.atleast_1d(np.asarray(angles, dtype=float))
+        sun = self.solar.planets.index(self.sun)
+        rows = [self.solar.planets.index(planet) for planet in (self.earth, self.mars)]
+        q = self.solar.positions[rows] - self.solar.positions[sun]
+        v = self.solar.velocities[rows] - self.solar.velocities[sun]
+        mu = self.solar.G * (self.sun.mass + self.solar.masses[rows])
+        if span is None:
+            motions = [self.orbit.calc_mean_motion(planet, self.sun) for planet in (self.earth, self.mars)]
+            span = 2 * math.pi / abs(motions[0] - motions[1])
+        times = np.arange(0, span + 2 * resolution, resolution)
+        positions = kepler_ephemeris(q, v, mu, times)[0]
+        longitudes = np.arctan2(positions[..., 1], positions[..., 0])
+        phase = wrap_angle(longitudes[:, 1, np.newaxis] - longitudes[:, 0, np.newaxis] - (angles + math.pi))
+        launch_times = np.full(len(angles), np.nan)
+        for j in range(len(angles)):
+            # A sign change, not a wrap around
+            crossings = np.flatnonzero(((phase[:-1, j] < 0) != (phase[1:, j] < 0)) &
+                                       (np.abs(phase[1:, j] - phase[:-1, j]) < math.pi))
+            if len(crossings):
+                i = crossings[0]
+                fraction = -phase[i, j] / (phase[i + 1, j] - phase[i, j])
+                launch_times[j] = self.solar.time_passed + times[i] + fraction * resolution
+        return launch_times
 
-        # Find the closest distance between the Satellite and Mars
-        closest_distance = 1e99
-        while (self.solar.time_passed < self.solar.time_passed + self.calc_elliptical_orbit(self.earth, self.mars)):
-            self.solar.run_sim()
-            satellite_mars_distance = np.linalg.norm(self.mars.pos - self.satellite.pos)
-            if (satellite_mars_distance < closest_distance):
-                closest_distance = satellite_mars_distance
-        angle_fired = (mars_angle - math.pi) * 180 / math.pi
-        closest_distance /= 1000    # Convert m to km
+    def satellite_sim(self, angle):
+        """ Launches a Satellite from the given angle on Earth and returns (angle fired, closest distance to Mars) """
+        closest_distance = self.satellite_sweep([angle])[0, 0]
+        angle_fired = angle * 180 / math.pi
         return (angle_fired, closest_distance)
 
+    def satellite_sweep(self, angles, speeds=None):
+        """
+        Launches massless satellites for a grid of launch angles and initial speeds (m/s) in one run of the system
+        A satellite launches when Mars is (angle + pi) ahead of Earth, from the opposite side of the Sun like before,
+        and is tracked for one orbital period of the transfer ellipse. speeds=None uses the Hohmann transfer speed
+        Launch times and closest approaches are events, refined in between steps of the simulation
+        Returns the closest distance (km) between each satellite and Mars, shaped (len(angles), len(speeds))
+        """
+        angles = np.atleast_1d(np.asarray(angles, dtype=float))
+        n_speeds = 1 if speeds is None else len(speeds)
+        self.warm_up()
+
+        sun, earth, mars = (self.solar.planets.index(planet) for planet in (self.sun, self.earth, self.mars))
+        first_satellite = self.solar.n_test     # Satellites of earlier sweeps stay in the system, skip them
+        first_row = len(self.solar.positions)
+        launch = phase_angle_event(earth, mars, angles + math.pi, centre=sun, name="launch")
+        approach = distance_minimum_event(slice(first_row, None), mars, name="closest approach")
+        self.solar.add_event(launch)
+        self.solar.add_event(approach)
+        launched = np.zeros(len(angles), dtype=bool)
+        satellite_slots = np.zeros((len(angles), n_speeds), dtype=int)
+        closest_distance = np.zeros(0)
+        end_time = np.zeros(0)
+
+        while not np.all(launched) or self.solar.time_passed < np.max(end_time):
+            self.solar.run_sim()
+            records, self.solar.event_log = self.solar.event_log, []
+            with self.solar.phase("launches and approaches"):
+                for record in records:
+                    if record.name == "launch" and not launched[record.index]:
+                        state = record.state
+                        r1 = np.linalg.norm(state.positions[earth] - state.positions[sun])
+                        r2 = np.linalg.norm(state.positions[mars] - state.positions[sun])
+                        launch_speeds = [self.calc_transfer_speed(r1, r2)] if speeds is None else speeds
+                        direction = state.velocities[earth] / np.linalg.norm(state.velocities[earth])
+                        satellite_pos = np.tile((-1) * state.positions[earth], (n_speeds, 1))
+                        satellite_velo = (-1) * np.outer(launch_speeds, direction)
+                        slots = self.solar.add_test_particles(satellite_pos, satellite_velo, launch_time=record.time)
+                        satellite_slots[record.index] = slots - first_satellite
+                        closest_distance = np.append(closest_distance, np.full(n_speeds, np.inf))
+                        end_time = np.append(end_time, np.full(n_speeds, record.time +
+                                                               self.calc_elliptical_orbit(self.earth, self.mars)))
+                        launched[record.index] = True
+                    elif record.name == "closest approach" and record.time <= end_time[record.index]:
+                        closest_distance[record.index] = min(closest_distance[record.index], record.value)
+
+            # The sampled distances cover closest approaches at the very start or end of a satellite's flight
+            if len(closest_distance):
+                with self.solar.phase("distance sampling"):
+                    satellites = self.solar.positions[first_row:]
+                    satellite_mars_distance = np.linalg.norm(satellites - self.solar.positions[mars], axis=1)
+                    np.minimum(closest_distance, satellite_mars_distance, out=closest_distance,
+                               where=(self.solar.time_passed <= end_time))
+        self.solar.events.remove(launch)
+        self.solar.events.remove(approach)
+        return closest_distance[satellite_slots] / 1000     # Convert m to km
+
+    def transfer_windows(self, departure_times, flight_times, count=5, check=False):
+        """
+        The cheapest Earth to Mars transfers over a grid of departure times (s from now) and flight times (s), from
+        Lambert transfers between the Kepler orbits of both planets, as TransferWindows in simulation time
+        check=True also flies every window in a fork of the N-body system, returning (window, closest distance in km)
+        """
+        ephemeris = KeplerEphemeris.from_solar(self.solar, ["Earth", "Mars"])
+        grid = porkchop_sweep(ephemeris, departure_times, flight_times, self.solar.G * self.sun.mass)
+        windows = [window._replace(departure_time=self.solar.time_passed + window.departure_time)
+                   for window in best_windows(grid, count)]
+        if not check:
+            return windows
+        return [(window, check_window(self.solar.fork(), window)[0]) for window in windows]
+
     def get_ideal_angle(self):
         ideal_angle = self.calc_phase_angle(self.earth, self.mars) * 180 / math.pi
         print("Ideal launch angle: " + str(ideal_angle) + "°")
@@ -1,18 +1,43 @@
 """
 HohmannAnimation - A simple animation with hard-coded values demonstrating a satellite fly-past of Mars
+With ephemeris=True the planets and the satellite follow their Kepler orbits from input_params.txt instead
 """
 
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from Scenario import load_scenario
+from Render import FRAME_NAME, encode_video
+from Sweep import run_sweep
+from Kepler import kepler_ephemeris
+from Events import wrap_angle
+import numpy as np
 import math
+import os
+
+
+AU = 1.496E11
+DAY = 24 * 60 ** 2
 
 
 class HohmannAnimation:
-    def __init__(self, angle=44, period=518.5, full_orbit=False):
+    def __init__(self, angle=44, period=518.5, full_orbit=False, ephemeris=False, g=6.6743E-11, headless=False):
+        """
+        ephemeris: launches when Mars really is `angle` degrees ahead of Earth, one frame per day, with the transfer
+        orbit and the planets computed from Kepler's equation for every frame at once
+        headless: draws on an Agg figure outside pyplot, which needs no display (see render)
+        """
+        self.options = {"angle": angle, "period": period, "full_orbit": full_orbit, "ephemeris": ephemeris, "g": g}
         self.angle = angle
         self.satellite_period = period
-        self.fig = plt.figure()
-        self.ax = plt.axes()
+        if headless:
+            self.fig = Figure()
+            FigureCanvasAgg(self.fig)
+            self.ax = self.fig.add_subplot()
+        else:
+            self.fig = plt.figure()
+            self.ax = plt.axes()
         self.orbit = plt.Circle((0, 0), radius=1.75, fill=False, color="white")
         self.sun = plt.Circle((0, 0), radius=0.5, fill=True, color="yellow")
         self.earth = plt.Circle((0, 0), radius=0.09, fill=True, color="blue")
@@ -22,6 +47,39 @@ class HohmannAnimation:
             self.frames = 520
         else:
             self.frames = 250
+        self.paths = self.calc_ephemeris(g) if ephemeris else None
+
+    def calc_ephemeris(self, g, resolution=DAY):
+        """
+        (frames, 3, 2) positions in AU of Earth, Mars and the satellite, one frame a day from the launch, rotated so
+        Earth starts on the x axis like in the hard-coded animation
+        """
+        scenario = load_scenario()
+        sun, earth, mars = (scenario.index(name) for name in ("Sun", "Earth", "Mars"))
+        q = scenario.positions[[earth, mars]] - scenario.positions[sun]
+        v = scenario.velocities[[earth, mars]] - scenario.velocities[sun]
+        mu = g * (scenario.masses[sun] + scenario.masses[[earth, mars]])
+
+        # The first day Mars is the launch angle ahead of Earth, within one synodic period (less than 800 days)
+        days = np.arange(0, 800 * DAY, resolution)
+        positions, velocities = kepler_ephemeris(q, v, mu, days)
+        longitudes = np.arctan2(positions[..., 1], positions[..., 0])
+        phase = wrap_angle(longitudes[:, 1] - longitudes[:, 0] - self.angle * math.pi / 180)
+        launch = np.flatnonzero(((phase[:-1] < 0) != (phase[1:] < 0)) & (np.abs(np.diff(phase)) < math.pi))[0]
+
+        earth_pos, earth_velo = positions[launch, 0], velocities[launch, 0]
+        r1, r2 = np.linalg.norm(earth_pos), np.linalg.norm(positions[launch, 1])
+        transfer_speed = math.sqrt(2 * g * scenario.masses[sun] * (r2 / (r1 * (r1 + r2))))
+        satellite_velo = transfer_speed * earth_velo / np.linalg.norm(earth_velo)
+
+        times = np.arange(self.frames) * resolution
+        planets = kepler_ephemeris(q, v, mu, days[launch] + times)[0]
+        satellite = kepler_ephemeris(earth_pos[np.newaxis], satellite_velo[np.newaxis], g * scenario.masses[sun],
+                                     times)[0]
+        paths = np.concatenate([planets, satellite], axis=1) / AU
+        rotation = -longitudes[launch, 0]
+        return np.stack([math.cos(rotation) * paths[..., 0] - math.sin(rotation) * paths[..., 1],
+                         math.sin(rotation) * paths[..., 0] + math.cos(rotation) * paths[..., 1]], axis=-1)
 
     def init(self):
         self.earth.center = (0, 0)
@@ -34,6 +92,11 @@ class HohmannAnimation:
 
     def animate(self, i):
         """ Animation for the Earth, Mars, and the Satellite """
+        if self.paths is not None:
+            for body, pos in zip((self.earth, self.mars, self.satellite), self.paths[i]):
+                body.center = (pos[0], pos[1])
+            return self.earth, self.mars, self.satellite
+
         earth_x = math.cos(2 * math.pi * i / 365)
         earth_y = math.sin(2 * math.pi * i / 365)
         self.earth.center = (earth_x, earth_y)
@@ -50,10 +113,45 @@ class HohmannAnimation:
 
         return self.earth, self.mars, self.satellite
 
-    def run_sim(self):
+    def draw_background(self):
         self.ax.add_patch(self.orbit)
         self.ax.add_patch(self.sun)
-        plt.axis("scaled")
+        self.ax.axis("scaled")
+        self.ax.set_title("Simulation of launching a satellite from Earth to Mars")
+
+    def run_sim(self):
+        self.draw_background()
         anim = FuncAnimation(self.fig, self.animate, init_func=self.init, frames=self.frames, interval=20, blit=True)
-        plt.title("Simulation of launching a satellite from Earth to Mars")
         plt.show()
+
+    def render(self, directory, workers=None, video=None, fps=30, dpi=100):
+        """
+        Saves every frame into directory as PNG without a display, split across worker processes like
+        Render.render_frames, and joins them into a video if one is given and ffmpeg is installed
+        Returns the video path, or None when there is no video
+        """
+        os.makedirs(directory, exist_ok=True)
+        workers = workers or os.cpu_count() or 1
+        bounds = np.linspace(0, self.frames, min(self.frames, workers * 4) + 1).astype(int)
+        tasks = [{"options": self.options, "start": int(start), "stop": int(stop),
+                  "directory": os.path.abspath(directory), "dpi": dpi} for start, stop in zip(bounds[:-1], bounds[1:])]
+        if workers == 1:
+            for task in tasks:
+                render_hohmann_range(**task)
+        else:
+            for result in run_sweep(render_hohmann_range, tasks, max_workers=workers, progress=None):
+                if result.error is not None:
+                    raise RuntimeError("Rendering frames " + str(result.params["start"]) + " to " +
+                                       str(result.params["stop"]) + " failed: " + result.error)
+        return None if video is None else encode_video(directory, video, fps)
+
+
+def render_hohmann_range(options, start, stop, directory, dpi=100):
+    """ One worker's share of HohmannAnimation.render, on a headless animation of its own """
+    animation = HohmannAnimation(headless=True, **options)
+    animation.draw_background()
+    animation.init()
+    for i in range(start, stop):
+        animation.animate(i)
+        animation.fig.savefig(os.path.join(directory, FRAME_NAME % i), dpi=dpi)
+    return stop - start
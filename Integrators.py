@@ -0,0 +1,390 @@
+"""
+Integrators - The integration schemes a Solar system can be stepped with, selected by name
+Every integrator works on a system with positions, velocities, current_accels, previous_accels and calc_accels,
+and leaves current_accels holding the accelerations at the new positions so the next step can reuse them
+"""
+
+from Kepler import kepler_drift
+import numpy as np
+import math
+
+
+INTEGRATORS = {}
+
+
+def register_integrator(cls):
+    """ Class decorator that makes an integrator available by its name (and aliases) """
+    for name in (cls.name,) + cls.aliases:
+        INTEGRATORS[name] = cls
+    return cls
+
+
+def make_integrator(name, **options):
+    if name not in INTEGRATORS:
+        raise ValueError("Unknown integrator: " + str(name) + " (choose from " + ", ".join(sorted(INTEGRATORS)) + ")")
+    return INTEGRATORS[name](**options)
+
+
+class Integrator:
+    name = None
+    aliases = ()
+
+    def __init__(self):
+        self.options = {}
+        self.accepted_steps = 0
+        self.rejected_steps = 0
+
+    def resize(self, shape):
+        """ Allocates the workspaces for state arrays of the given shape """
+        self._work = np.zeros(shape)
+        self._next_accels = np.zeros(shape)
+
+    def state(self):
+        """ The arrays the integrator carries from one step to the next besides the system's, kept in snapshots """
+        return {}
+
+    def set_state(self, state):
+        """ Continues from the state() of a snapshot, or starts over when it is empty """
+        self.reset()
+
+    def reset(self):
+        """ Forgets what was carried over from earlier steps, e.g. when the system jumped to another state """
+
+    def step(self, system, h):
+        """ Advances the system by h seconds and returns the step actually taken """
+        raise NotImplementedError
+
+    def kick(self, system, h):
+        """ v += a * h with the accelerations at the current positions """
+        np.multiply(system.current_accels, h, out=self._work)
+        system.velocities += self._work
+
+    def drift(self, system, h):
+        np.multiply(system.velocities, h, out=self._work)
+        system.positions += self._work
+
+    def update_accels(self, system):
+        """ The next accelerations become the current ones for the next step """
+        next_accels = system.calc_accels(system.positions, self._next_accels)
+        system.previous_accels[...] = system.current_accels
+        system.current_accels[...] = next_accels
+
+
+@register_integrator
+class Beeman(Integrator):
+    name = "beeman"
+
+    def step(self, system, h):
+        work = self._work
+        # The following is Beeman Formula 1
+        np.multiply(system.current_accels, 4, out=work)
+        work -= system.previous_accels
+        work *= (h ** 2) / 6
+        system.positions += work
+        self.drift(system, h)
+        # The following is Beeman Formula 2
+        next_accels = system.calc_accels(system.positions, self._next_accels)
+        np.multiply(system.current_accels, 5, out=work)
+        work -= system.previous_accels
+        work += next_accels
+        work += next_accels
+        work *= h / 6
+        system.velocities += work
+        system.previous_accels[...] = system.current_accels
+        system.current_accels[...] = next_accels
+        self.accepted_steps += 1
+        return h
+
+
+@register_integrator
+class ForwardEuler(Integrator):
+    name = "euler"
+    aliases = ("forward-euler",)
+
+    def step(self, system, h):
+        # The following are the Direct-Euler Formulas 1 and 2
+        self.drift(system, h)
+        self.kick(system, h)
+        self.update_accels(system)
+        self.accepted_steps += 1
+        return h
+
+
+@register_integrator
+class VelocityVerlet(Integrator):
+    """ Kick-drift-kick leapfrog: symplectic and time-reversible, so the energy error stays bounded """
+    name = "verlet"
+    aliases = ("leapfrog",)
+
+    def step(self, system, h):
+        self.leapfrog(system, h)
+        self.accepted_steps += 1
+        return h
+
+    def leapfrog(self, system, h):
+        self.kick(system, h / 2)
+        self.drift(system, h)
+        self.update_accels(system)
+        self.kick(system, h / 2)
+
+
+@register_integrator
+class Yoshida4(VelocityVerlet):
+    """ Three leapfrog substeps with Yoshida's weights cancel the 2nd order error, giving a 4th order scheme """
+    name = "yoshida4"
+    W1 = 1 / (2 - 2 ** (1 / 3))
+    W0 = -(2 ** (1 / 3)) / (2 - 2 ** (1 / 3))
+
+    def step(self, system, h):
+        for weight in (self.W1, self.W0, self.W1):
+            self.leapfrog(system, weight * h)
+        self.accepted_steps += 1
+        return h
+
+
+@register_integrator
+class WisdomHolman(Integrator):
+    """
+    Wisdom-Holman map in democratic heliocentric coordinates: every body follows its exact Kepler orbit around the
+    central (most massive) body, and only the small pulls between the other bodies are integrated by kicks
+    """
+    name = "wisdom-holman"
+    aliases = ("wh",)
+
+    def step(self, system, h):
+        n = system.n_massive
+        masses = system.masses
+        gm_central = system.G * np.max(masses)
+        central = int(np.argmax(masses))
+        others = np.arange(len(system.positions)) != central
+        massive_others = others.copy()
+        massive_others[n:] = False
+        total_mass = np.sum(masses)
+
+        # Heliocentric positions, barycentric velocities
+        barycentre = np.einsum("i,ij->j", masses, system.positions[:n]) / total_mass
+        barycentre_velo = np.einsum("i,ij->j", masses, system.velocities[:n]) / total_mass
+        q = system.positions[others] - system.positions[central]
+        v = system.velocities[others] - barycentre_velo
+        other_masses = np.zeros(len(q))
+        other_masses[:n - 1] = masses[massive_others[:n]]
+
+        def interaction(accels, q):
+            """ All the accelerations minus the pull of the central body """
+            r = np.linalg.norm(q, axis=1)
+            return accels[others] + gm_central * q / (r ** 3)[:, np.newaxis]
+
+        def central_drift(q, v, dt):
+            return q + (dt / masses[central]) * np.einsum("i,ij->j", other_masses, v)
+
+        v = v + (h / 2) * interaction(system.current_accels, q)
+        q = central_drift(q, v, h / 2)
+        q, v = kepler_drift(q, v, gm_central, h)
+        q = central_drift(q, v, h / 2)
+
+        # Back to the frame the system is simulated in, so the interaction kick can use the force backend
+        central_pos = barycentre + barycentre_velo * h - np.einsum("i,ij->j", other_masses, q) / total_mass
+        system.positions[central] = central_pos
+        system.positions[others] = q + central_pos
+        self.update_accels(system)
+        v = v + (h / 2) * interaction(system.current_accels, q)
+        system.velocities[others] = v + barycentre_velo
+        system.velocities[central] = barycentre_velo - np.einsum("i,ij->j", other_masses, v) / masses[central]
+        self.accepted_steps += 1
+        return h
+
+
+@register_integrator
+class DormandPrince(Integrator):
+    """
+    Dormand-Prince 5(4), which changes the timestep to keep an error estimate within the tolerance:
+    the step grows during quiet cruises and shrinks around close approaches
+    """
+    name = "dopri5"
+    aliases = ("adaptive",)
+
+    # Dormand-Prince coefficients, the last row of A is also the 5th order solution
+    A = [[],
+         [1 / 5],
+         [3 / 40, 9 / 40],
+         [44 / 45, -56 / 15, 32 / 9],
+         [19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729],
+         [9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656],
+         [35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84]]
+    E = [71 / 57600, 0, -71 / 16695, 71 / 1920, -17253 / 339200, 22 / 525, -1 / 40]  # 5th minus 4th order weights
+
+    def __init__(self, tolerance=1e-10, min_timestep=1, max_timestep=None):
+        """ tolerance: the largest error allowed in a step, relative to the size of the system and its speeds """
+        super().__init__()
+        self.options = {"tolerance": tolerance, "min_timestep": min_timestep, "max_timestep": max_timestep}
+        self.tolerance = tolerance
+        self.min_timestep = min_timestep
+        self.max_timestep = max_timestep
+
+    def resize(self, shape):
+        super().resize(shape)
+        self._stage_velocities = [np.zeros(shape) for _ in range(7)]
+        self._stage_accels = [np.zeros(shape) for _ in range(7)]
+        self._stage_pos = np.zeros(shape)
+        self._pos_error = np.zeros(shape)
+        self._velo_error = np.zeros(shape)
+
+    def attempt_step(self, system, h):
+        """ Calculates a Dormand-Prince step of size h into the workspaces and returns its scaled error """
+        velocities, accels = self._stage_velocities, self._stage_accels
+        velocities[0][...] = system.velocities
+        accels[0][...] = system.current_accels     # First Same As Last: the last stage of the previous step
+        for i in range(1, 7):
+            self._stage_pos[...] = system.positions
+            velocities[i][...] = system.velocities
+            for j, a in enumerate(self.A[i]):
+                if a != 0:
+                    self._stage_pos += (h * a) * velocities[j]
+                    velocities[i] += (h * a) * accels[j]
+            system.calc_accels(self._stage_pos, accels[i])
+
+        self._pos_error.fill(0)
+        self._velo_error.fill(0)
+        for j, e in enumerate(self.E):
+            if e != 0:
+                self._pos_error += (h * e) * velocities[j]
+                self._velo_error += (h * e) * accels[j]
+        pos_scale = self.tolerance * math.sqrt(np.mean(np.sum(system.positions ** 2, axis=-1)))
+        velo_scale = self.tolerance * math.sqrt(np.mean(np.sum(system.velocities ** 2, axis=-1)))
+        pos_error = math.sqrt(np.max(np.sum(self._pos_error ** 2, axis=-1))) / pos_scale
+        velo_error = math.sqrt(np.max(np.sum(self._velo_error ** 2, axis=-1))) / velo_scale
+        return max(pos_error, velo_error)
+
+    def step(self, system, h):
+        """ Takes one accepted step, retrying with a smaller timestep whenever the error is above the tolerance """
+        while True:
+            error = self.attempt_step(system, h)
+            factor = 5 if error == 0 else min(5, max(0.2, 0.9 * error ** -0.2))
+            next_h = max(h * factor, self.min_timestep)
+            if self.max_timestep is not None:
+                next_h = min(next_h, self.max_timestep)
+            if error <= 1 or h <= self.min_timestep:
+                break
+            self.rejected_steps += 1
+            h = next_h
+        self.accepted_steps += 1
+        system.timestep = next_h    # The step the error estimate suggests next
+        system.positions[...] = self._stage_pos
+        system.velocities[...] = self._stage_velocities[6]
+        system.previous_accels[...] = system.current_accels
+        system.current_accels[...] = self._stage_accels[6]
+        return h
+
+
+@register_integrator
+class BlockTimesteps(Integrator):
+    """
+    Hierarchical block timesteps: every body steps with h / 2 ** level, the longest power-of-two fraction of the step
+    within eta times its shortest timescale, so quiet bodies are updated rarely and perturbed ones (a satellite
+    passing a planet) often. The timescales are the free fall and passage times past every planet, and the time the
+    body's own acceleration takes to change
+    Only the bodies due at a substep have their accelerations calculated, from where the others are predicted to be
+    by the Taylor series of their last update. The update is Beeman's with the acceleration at the start of the body's
+    own step in place of the one before it. Every body is due at the end of the step, so between steps the state is
+    complete like with the other integrators
+    """
+    name = "block"
+    aliases = ("block-timesteps",)
+
+    def __init__(self, eta=0.02, max_level=10):
+        """ max_level: the shortest substep is h / 2 ** max_level """
+        super().__init__()
+        self.options = {"eta": eta, "max_level": max_level}
+        self.eta = eta
+        self.max_level = max_level
+
+    def resize(self, shape):
+        super().resize(shape)
+        self._predicted_velo = np.zeros(shape)
+        self._jerk = np.zeros(shape)
+        self.levels = None    # Chosen again at the next step, like the accelerations of a new set of bodies
+
+    def state(self):
+        return {} if self.levels is None else {"levels": self.levels.copy(), "jerk": self._jerk.copy()}
+
+    def set_state(self, state):
+        if state:
+            self.levels = np.array(state["levels"], dtype=int)
+            self._jerk[...] = state["jerk"]
+        else:
+            self.reset()
+
+    def reset(self):
+        self.levels = None
+
+    def timescales(self, system, rows, positions, velocities):
+        """ The shortest timescale of each of the given rows, with the other bodies at the given state """
+        n = system.n_massive
+        disp = positions[np.newaxis, :n] - positions[rows, np.newaxis]
+        dist_squared = np.einsum("ijk,ijk->ij", disp, disp)
+        relative_velo = velocities[np.newaxis, :n] - velocities[rows, np.newaxis]
+        speed_squared = np.einsum("ijk,ijk->ij", relative_velo, relative_velo)
+        own_masses = np.where(rows < n, system.masses[np.minimum(rows, n - 1)], 0)
+        gm = system.G * (system.masses[np.newaxis] + own_masses[:, np.newaxis])
+        accels, jerks = system.current_accels[rows], self._jerk[rows]
+        # Compared as squares, so there is a single square root per row
+        with np.errstate(divide="ignore", invalid="ignore"):
+            free_fall = dist_squared * np.sqrt(dist_squared) / gm
+            passage = dist_squared / speed_squared
+            changing = np.einsum("ij,ij->i", accels, accels) / np.einsum("ij,ij->i", jerks, jerks)
+        shortest = np.min(np.where(dist_squared > 0, np.minimum(free_fall, passage), np.inf), axis=1, initial=np.inf)
+        return np.sqrt(np.fmin(shortest, changing))
+
+    def choose_levels(self, system, rows, h, tick, positions, velocities):
+        """ The level of each row from its timescale, only coarser by one level and where tick lines up with it """
+        with np.errstate(divide="ignore"):
+            levels = np.ceil(np.log2(h / (self.eta * self.timescales(system, rows, positions, velocities))))
+        levels = np.clip(levels, 0, self.max_level).astype(int)
+        if self.levels is None:
+            return levels
+        levels = np.maximum(levels, self.levels[rows] - 1)
+        coarser = (levels < self.levels[rows]) & (tick % 2 ** (self.max_level - levels) != 0)
+        levels[coarser] = self.levels[rows][coarser]
+        return levels
+
+    def step(self, system, h):
+        positions, velocities = system.positions, system.velocities
+        predicted, predicted_velo = self._work, self._predicted_velo
+        top = 2 ** self.max_level     # Substeps are counted in ticks of h / top
+        rows = np.arange(len(positions))
+        if self.levels is None:
+            self._jerk.fill(0)
+            self.levels = self.choose_levels(system, rows, h, 0, positions, velocities)
+        last = np.zeros(len(positions), dtype=np.int64)
+        tick = 0
+        while tick < top:
+            due = last + 2 ** (self.max_level - self.levels)
+            tick = int(np.min(due))
+            active = np.flatnonzero(due == tick)
+            tau = ((tick - last) * (h / top))[:, np.newaxis]
+            # Where every body is now from its last update, the due ones included
+            np.multiply(self._jerk, tau / 3, out=predicted)
+            predicted += system.current_accels
+            predicted *= tau / 2
+            predicted += velocities
+            predicted *= tau
+            predicted += positions
+            np.multiply(self._jerk, tau / 2, out=predicted_velo)
+            predicted_velo += system.current_accels
+            predicted_velo *= tau
+            predicted_velo += velocities
+
+            system.calc_accels(predicted, self._next_accels, targets=active)
+            dt = tau[active]
+            accels, next_accels = system.current_accels[active], self._next_accels[active]
+            positions[active] += velocities[active] * dt + (2 * accels + next_accels) * (dt ** 2 / 6)
+            velocities[active] += (accels + next_accels) * (dt / 2)
+            self._jerk[active] = (next_accels - accels) / dt
+            system.previous_accels[active] = accels
+            system.current_accels[active] = next_accels
+            last[active] = tick
+            predicted[active] = positions[active]
+            predicted_velo[active] = velocities[active]
+            self.levels[active] = self.choose_levels(system, active, h, tick % top, predicted, predicted_velo)
+        self.accepted_steps += 1
+        return h
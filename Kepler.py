@@ -0,0 +1,142 @@
+"""
+Kepler - Analytic two-body motion around a central body, for arrays of bodies and times at once
+Orbits are described by their elements: semi-major axis, eccentricity, the angle of the periapsis, the mean anomaly at
+the reference time, the mean motion and the direction (+1 anticlockwise, -1 clockwise)
+"""
+
+from collections import namedtuple
+import numpy as np
+
+
+Elements = namedtuple("Elements", ["a", "e", "periapsis", "mean_anomaly", "mean_motion", "direction"])
+
+
+def stumpff(z):
+    """ The Stumpff functions C(z) and S(z), with a series near z = 0 where the closed forms lose precision """
+    z = np.asarray(z, dtype=float)
+    c = np.empty_like(z)
+    s = np.empty_like(z)
+    small = np.abs(z) < 1e-6
+    positive = (z > 0) & ~small
+    negative = (z < 0) & ~small
+    root = np.sqrt(np.abs(z))
+    c[positive] = (1 - np.cos(root[positive])) / z[positive]
+    s[positive] = (root[positive] - np.sin(root[positive])) / root[positive] ** 3
+    c[negative] = (np.cosh(root[negative]) - 1) / -z[negative]
+    s[negative] = (np.sinh(root[negative]) - root[negative]) / root[negative] ** 3
+    c[small] = 1 / 2 - z[small] / 24 + z[small] ** 2 / 720
+    s[small] = 1 / 6 - z[small] / 120 + z[small] ** 2 / 5040
+    return c, s
+
+
+def kepler_drift(positions, velocities, mu, dt, max_iterations=200):
+    """
+    Moves (N, 2) positions and velocities relative to the central body along their conic sections for dt seconds,
+    using universal variables and the f and g functions so elliptic and hyperbolic orbits are handled alike
+    mu is G * central mass (a scalar or one per body), dt a scalar or one per body
+    """
+    r0 = np.linalg.norm(positions, axis=-1)
+    vr0 = np.einsum("...i,...i->...", positions, velocities) / r0
+    v_squared = np.einsum("...i,...i->...", velocities, velocities)
+    mu = np.broadcast_to(np.asarray(mu, dtype=float), r0.shape)
+    dt = np.broadcast_to(np.asarray(dt, dtype=float), r0.shape)
+    alpha = 2 / r0 - v_squared / mu    # 1 / semi-major axis
+    sqrt_mu = np.sqrt(mu)
+
+    # The time grows with chi at r / sqrt(mu), and r never drops below the periapsis distance q, which bounds chi
+    h = positions[..., 0] * velocities[..., 1] - positions[..., 1] * velocities[..., 0]
+    p = h ** 2 / mu
+    q = p / (1 + np.sqrt(np.maximum(1 - p * alpha, 0)))
+    bound = sqrt_mu * dt / np.maximum(q, 1e-12 * r0)
+    lo, hi = np.minimum(bound, 0), np.maximum(bound, 0)
+
+    # Newton's method on the universal Kepler equation for the universal anomaly chi, falling back to bisection
+    # whenever a step leaves the bracket (it can overshoot far on eccentric orbits)
+    chi = np.clip(np.where(alpha > 0, sqrt_mu * dt * alpha, sqrt_mu * dt / r0), lo, hi)
+    with np.errstate(over="ignore", invalid="ignore"):
+        for _ in range(max_iterations):
+            z = alpha * chi ** 2
+            c, s = stumpff(z)
+            f = r0 * vr0 / sqrt_mu * chi ** 2 * c + (1 - alpha * r0) * chi ** 3 * s + r0 * chi - sqrt_mu * dt
+            df = r0 * vr0 / sqrt_mu * chi * (1 - z * s) + (1 - alpha * r0) * chi ** 2 * c + r0
+            above = (f > 0) | (np.isnan(f) & (chi > 0))    # Overflows only happen far beyond the root
+            hi = np.where(above, chi, hi)
+            lo = np.where(above, lo, chi)
+            newton = chi - f / df
+            new_chi = np.where((newton >= lo) & (newton <= hi), newton, (lo + hi) / 2)
+            step = new_chi - chi
+            chi = new_chi
+            if np.all(np.abs(step) <= 1e-13 * np.maximum(np.abs(chi), 1e-300)):
+                break
+
+    z = alpha * chi ** 2
+    c, s = stumpff(z)
+    f = 1 - chi ** 2 / r0 * c
+    g = dt - chi ** 3 / sqrt_mu * s
+    new_positions = f[..., np.newaxis] * positions + g[..., np.newaxis] * velocities
+    r = np.linalg.norm(new_positions, axis=-1)
+    f_dot = sqrt_mu / (r * r0) * (alpha * chi ** 3 * s - chi)
+    g_dot = 1 - chi ** 2 / r * c
+    new_velocities = f_dot[..., np.newaxis] * positions + g_dot[..., np.newaxis] * velocities
+    return new_positions, new_velocities
+
+
+def solve_kepler(mean_anomaly, e, tolerance=1e-14, max_iterations=50):
+    """ The eccentric anomaly E with E - e sin(E) = M for elliptic orbits, by Newton's method on whole arrays """
+    mean_anomaly, e = np.broadcast_arrays(np.asarray(mean_anomaly, dtype=float), np.asarray(e, dtype=float))
+    m = np.mod(mean_anomaly + np.pi, 2 * np.pi) - np.pi
+    eccentric = np.where(e < 0.8, m + e * np.sin(m), np.pi * np.sign(m))
+    for _ in range(max_iterations):
+        step = (eccentric - e * np.sin(eccentric) - m) / (1 - e * np.cos(eccentric))
+        eccentric = eccentric - step
+        if np.all(np.abs(step) <= tolerance):
+            break
+    return eccentric + (mean_anomaly - m)
+
+
+def state_to_elements(positions, velocities, mu):
+    """ The elements of elliptic orbits from (N, 2) positions and velocities relative to the central body """
+    r = np.linalg.norm(positions, axis=-1)
+    v_squared = np.einsum("...i,...i->...", velocities, velocities)
+    r_dot_v = np.einsum("...i,...i->...", positions, velocities)
+    h = positions[..., 0] * velocities[..., 1] - positions[..., 1] * velocities[..., 0]
+    direction = np.where(h < 0, -1.0, 1.0)
+    a = 1 / (2 / r - v_squared / mu)
+    if np.any(a <= 0):
+        raise ValueError("Only elliptic orbits have elements here, use kepler_drift for the others")
+    e_vector = ((v_squared - mu / r)[..., np.newaxis] * positions - r_dot_v[..., np.newaxis] * velocities) / \
+        np.asarray(mu, dtype=float)[..., np.newaxis]
+    e = np.linalg.norm(e_vector, axis=-1)
+    # A circular orbit has no periapsis, so its angles are measured from the x axis instead
+    periapsis = np.where(e > 1e-12, np.arctan2(e_vector[..., 1], e_vector[..., 0]), 0.0)
+    true_anomaly = direction * (np.arctan2(positions[..., 1], positions[..., 0]) - periapsis)
+    eccentric = 2 * np.arctan(np.sqrt((1 - e) / (1 + e)) * np.tan(true_anomaly / 2))
+    mean_anomaly = eccentric - e * np.sin(eccentric)
+    return Elements(a, e, periapsis, mean_anomaly, np.sqrt(mu / a ** 3), direction)
+
+
+def elements_to_state(elements, mu, dt=0.0):
+    """
+    Positions and velocities dt seconds after the reference time of the elements
+    dt broadcasts against the bodies, e.g. dt[:, np.newaxis] gives (len(dt), N, 2) arrays for N bodies
+    """
+    a, e, periapsis, mean_anomaly, mean_motion, direction = elements
+    eccentric = solve_kepler(mean_anomaly + mean_motion * np.asarray(dt, dtype=float), e)
+    cos_e, sin_e = np.cos(eccentric), np.sin(eccentric)
+    root = np.sqrt(1 - e ** 2)
+    # In the frame of the orbit (x towards the periapsis), then rotated to the periapsis angle
+    x = a * (cos_e - e)
+    y = direction * a * root * sin_e
+    speed_factor = a * mean_motion / (1 - e * cos_e)
+    vx = -speed_factor * sin_e
+    vy = direction * speed_factor * root * cos_e
+    cos_w, sin_w = np.cos(periapsis), np.sin(periapsis)
+    positions = np.stack([cos_w * x - sin_w * y, sin_w * x + cos_w * y], axis=-1)
+    velocities = np.stack([cos_w * vx - sin_w * vy, sin_w * vx + cos_w * vy], axis=-1)
+    return positions, velocities
+
+
+def kepler_ephemeris(positions, velocities, mu, times):
+    """ (len(times), N, 2) positions and velocities of N bodies on their Kepler orbits at every time (s) from now """
+    elements = state_to_elements(positions, velocities, mu)
+    return elements_to_state(elements, mu, np.asarray(times, dtype=float)[:, np.newaxis])
@@ -0,0 +1,192 @@
+"""
+Lambert - Transfer orbits between two positions in a given time, solved for whole grids of departure dates and times
+of flight at once, and the porkchop plots of the delta-v they need
+The positions of the planets come from an ephemeris: their Kepler orbits (KeplerEphemeris) or a recorded N-body
+run (TrajectoryEphemeris). Large grids are split into chunks of departure dates that run on Sweep.run_sweep
+"""
+
+from Kepler import stumpff, state_to_elements, elements_to_state
+from Events import EventState, interpolate_state, distance_minimum_event
+from Sweep import run_sweep
+from collections import namedtuple
+import numpy as np
+import math
+
+
+TransferWindow = namedtuple("TransferWindow", ["departure_time", "flight_time", "departure_dv", "arrival_dv",
+                                               "total_dv"])
+
+
+def lambert(r1, r2, flight_time, mu, iterations=80):
+    """
+    The velocities at both ends of the prograde (anticlockwise), less than one revolution transfer from r1 to r2 in
+    flight_time seconds, by bisection on the universal variable z for every transfer at once
+    r1, r2: (..., 2) positions relative to the central body, flight_time broadcasts against them
+    Returns (v1, v2), NaN where there is no such transfer (e.g. a transfer angle within 1e-6 rad of 0 or 2 pi)
+    """
+    r1, r2 = np.asarray(r1, dtype=float), np.asarray(r2, dtype=float)
+    flight_time = np.asarray(flight_time, dtype=float)
+    shape = np.broadcast_shapes(r1.shape[:-1], r2.shape[:-1], flight_time.shape)
+    r1, r2 = np.broadcast_to(r1, shape + (2,)), np.broadcast_to(r2, shape + (2,))
+    flight_time = np.broadcast_to(flight_time, shape)
+    r1_norm, r2_norm = np.linalg.norm(r1, axis=-1), np.linalg.norm(r2, axis=-1)
+    cross = r1[..., 0] * r2[..., 1] - r1[..., 1] * r2[..., 0]
+    cos_angle = np.clip(np.einsum("...i,...i->...", r1, r2) / (r1_norm * r2_norm), -1, 1)
+    angle = np.where(cross >= 0, np.arccos(cos_angle), 2 * math.pi - np.arccos(cos_angle))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        a = np.sin(angle) * np.sqrt(r1_norm * r2_norm / (1 - np.cos(angle)))
+
+        def y_of(z):
+            c, s = stumpff(z)
+            return r1_norm + r2_norm + a * (z * s - 1) / np.sqrt(c), c, s
+
+        # The time of flight grows with z, so bisection keeps the root between lo and hi (z < 4 pi^2: one revolution)
+        lo = np.full(shape, -4 * math.pi ** 2)
+        hi = np.full(shape, 4 * math.pi ** 2 - 1e-9)
+        for _ in range(iterations):
+            z = (lo + hi) / 2
+            y, c, s = y_of(z)
+            time = ((np.maximum(y, 0) / c) ** 1.5 * s + a * np.sqrt(np.maximum(y, 0))) / math.sqrt(mu)
+            too_short = (y < 0) | (time < flight_time)
+            lo = np.where(too_short, z, lo)
+            hi = np.where(too_short, hi, z)
+        y, c, s = y_of((lo + hi) / 2)
+        time = ((np.maximum(y, 0) / c) ** 1.5 * s + a * np.sqrt(np.maximum(y, 0))) / math.sqrt(mu)
+        f = 1 - y / r1_norm
+        g = a * np.sqrt(y / mu)
+        g_dot = 1 - y / r2_norm
+        v1 = (r2 - f[..., np.newaxis] * r1) / g[..., np.newaxis]
+        v2 = (g_dot[..., np.newaxis] * r2 - r1) / g[..., np.newaxis]
+    # No root below one revolution (the bisection ends at the edge), or a degenerate transfer angle: near 0 or 2 pi
+    # a stays finite, but rounding decides which way round the transfer goes
+    failed = ~np.isfinite(g) | (y < 0) | (np.abs(a) < 1e-12 * r1_norm) | \
+        (np.minimum(angle, 2 * math.pi - angle) < 1e-6) | ~(np.abs(time - flight_time) <= 1e-6 * flight_time)
+    v1[failed] = np.nan
+    v2[failed] = np.nan
+    return v1, v2
+
+
+class KeplerEphemeris:
+    """ Positions and velocities relative to the central body along the Kepler orbits of the chosen bodies """
+    def __init__(self, positions, velocities, mu):
+        self.mu = np.asarray(mu, dtype=float)
+        self.elements = state_to_elements(positions, velocities, self.mu)
+
+    @classmethod
+    def from_solar(cls, solar, names, centre="Sun"):
+        """ The orbits through the current state of the bodies of a Solar (times then count from solar.time_passed) """
+        rows = [solar.index(name) for name in names]
+        c = solar.index(centre)
+        return cls(solar.positions[rows] - solar.positions[c], solar.velocities[rows] - solar.velocities[c],
+                   solar.G * (solar.masses[c] + solar.masses[rows]))
+
+    def __call__(self, times):
+        """ (len(times), bodies, 2) positions and velocities """
+        return elements_to_state(self.elements, self.mu, np.asarray(times, dtype=float)[:, np.newaxis])
+
+
+class TrajectoryEphemeris:
+    """ Positions and velocities relative to the central body interpolated between the frames of a Trajectory """
+    def __init__(self, trajectory, names, centre="Sun"):
+        self.trajectory = trajectory
+        self.rows = [trajectory.index(name) for name in names]
+        self.centre = trajectory.index(centre)
+
+    def __call__(self, times):
+        """ All the times at once: the frames around every time are gathered in one read, then interpolated """
+        times = np.asarray(times, dtype=float)
+        recorded = np.asarray(self.trajectory.times)
+        after = np.clip(np.searchsorted(recorded, times), 1, len(recorded) - 1)[:, np.newaxis]
+        rows = self.rows + [self.centre]
+        s0, s1 = (EventState(recorded[frames][:, :, np.newaxis], self.trajectory.positions[frames, rows],
+                             self.trajectory.velocities[frames, rows]) for frames in (after - 1, after))
+        state = interpolate_state(s0, s1, times[:, np.newaxis, np.newaxis])
+        return state.positions[:, :-1] - state.positions[:, -1:], state.velocities[:, :-1] - state.velocities[:, -1:]
+
+
+def porkchop(ephemeris, departure_times, flight_times, mu):
+    """
+    The departure and arrival delta-v (m/s) of every (departure time, time of flight) cell, for the first body of the
+    ephemeris to the second: (len(departure_times), len(flight_times)) arrays, NaN where Lambert has no solution
+    """
+    departure_times = np.asarray(departure_times, dtype=float)
+    flight_times = np.asarray(flight_times, dtype=float)
+    positions, velocities = ephemeris(departure_times)
+    arrival_times = departure_times[:, np.newaxis] + flight_times
+    arrival_positions, arrival_velocities = ephemeris(arrival_times.ravel())
+    arrival_positions = arrival_positions[:, 1].reshape(arrival_times.shape + (2,))
+    arrival_velocities = arrival_velocities[:, 1].reshape(arrival_times.shape + (2,))
+    v1, v2 = lambert(positions[:, np.newaxis, 0], arrival_positions, flight_times, mu)
+    departure_dv = np.linalg.norm(v1 - velocities[:, np.newaxis, 0], axis=-1)
+    arrival_dv = np.linalg.norm(arrival_velocities - v2, axis=-1)
+    return {"departure_times": departure_times, "flight_times": flight_times, "departure_dv": departure_dv,
+            "arrival_dv": arrival_dv, "total_dv": departure_dv + arrival_dv}
+
+
+def porkchop_sweep(ephemeris, departure_times, flight_times, mu, chunk_cells=20000, max_workers=None):
+    """ porkchop, with the departure dates split into chunks of about chunk_cells cells on worker processes """
+    departure_times = np.asarray(departure_times, dtype=float)
+    rows = max(1, chunk_cells // max(1, len(flight_times)))
+    chunks = [{"ephemeris": ephemeris, "departure_times": departure_times[i:i + rows], "flight_times": flight_times,
+               "mu": mu} for i in range(0, len(departure_times), rows)]
+    if len(chunks) == 1:
+        return porkchop(ephemeris, departure_times, flight_times, mu)
+    results = {}
+    for result in run_sweep(porkchop, chunks, max_workers=max_workers, progress=None):
+        if result.error is not None:
+            raise RuntimeError("A porkchop chunk failed: " + result.error)
+        results[result.params["departure_times"][0]] = result.value
+    ordered = [results[start] for start in sorted(results)]
+    grid = {"departure_times": departure_times, "flight_times": np.asarray(flight_times, dtype=float)}
+    for name in ("departure_dv", "arrival_dv", "total_dv"):
+        grid[name] = np.concatenate([chunk[name] for chunk in ordered])
+    return grid
+
+
+def best_windows(grid, count=5):
+    """ The count cheapest cells that are local minima of the total delta-v, cheapest first """
+    total = np.where(np.isfinite(grid["total_dv"]), grid["total_dv"], np.inf)
+    padded = np.pad(total, 1, constant_values=np.inf)
+    minimum = np.ones(total.shape, dtype=bool)
+    for di in (-1, 0, 1):
+        for dj in (-1, 0, 1):
+            if di or dj:
+                neighbour = padded[1 + di:padded.shape[0] - 1 + di, 1 + dj:padded.shape[1] - 1 + dj]
+                minimum &= total <= neighbour
+    cells = np.argwhere(minimum & np.isfinite(total))
+    cells = cells[np.argsort(total[minimum & np.isfinite(total)], kind="stable")][:count]
+    return [TransferWindow(grid["departure_times"][i], grid["flight_times"][j], grid["departure_dv"][i, j],
+                           grid["arrival_dv"][i, j], grid["total_dv"][i, j]) for i, j in cells]
+
+
+def check_window(solar, window, origin="Earth", target="Mars", centre="Sun"):
+    """
+    Flies a window in the full N-body system: integrates the Solar to the departure time, launches a massless
+    satellite from the origin on the Lambert transfer through the origin and target positions of the simulation, and
+    returns (closest distance to the target in km, time of the closest approach)
+    The origin planet is left out of the system, since the satellite starts at its centre (a patched conic)
+    """
+    solar.run_until(window.departure_time)
+    if solar.time_passed > window.departure_time:     # Steps back onto the departure time along the Kepler orbits
+        solar.fast_forward(window.departure_time - solar.time_passed)
+    target_ephemeris = KeplerEphemeris.from_solar(solar, [target], centre)
+    arrival = target_ephemeris(np.array([window.flight_time]))[0][0, 0]
+    c, o = solar.index(centre), solar.index(origin)
+    start = solar.positions[o] - solar.positions[c]
+    v1 = lambert(start, arrival, window.flight_time, target_ephemeris.mu[0])[0]
+    satellite_pos = solar.positions[o].copy()
+    satellite_velo = solar.velocities[c] + v1
+    solar.planets = [planet for planet in solar.planets if planet.name != origin]
+    row = solar.n_massive + solar.add_test_particles(satellite_pos[np.newaxis], satellite_velo[np.newaxis])[0]
+    approach = distance_minimum_event(row, solar.index(target), name="closest approach")
+    solar.add_event(approach)
+    end_time = window.departure_time + window.flight_time * 1.5
+    closest = (np.inf, None)
+    while solar.time_passed < end_time:
+        solar.run_sim()
+        records, solar.event_log = solar.event_log, []
+        for record in records:
+            if record.name == "closest approach" and record.value < closest[0]:
+                closest = (record.value, record.time)
+    solar.events.remove(approach)
+    return closest[0] / 1000, closest[1]
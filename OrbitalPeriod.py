@@ -4,14 +4,23 @@ OrbitalPeriod - Finds the relative orbital periods of the other planets to Earth
 
 from Solar import Solar
 from numpy.linalg import norm
-from math import pi
+from math import pi, sqrt
 
 
 class OrbitalPeriod:
-    def __init__(self):
-        self.solar = Solar()
+    def __init__(self, scenario=None):
+        """ scenario: a Scenario or scenario file instead of input_params.txt """
+        self.scenario = scenario
+        self._solar = None
         self.orbital_periods_log = "orbital_periods.txt"
 
+    @property
+    def solar(self):
+        """ Only built when the periods are asked for, most users only need the static functions """
+        if self._solar is None:
+            self._solar = Solar(scenario=self.scenario)
+        return self._solar
+
     @staticmethod
     def calc_orbital_period(planet):
         """ 2 * pi * orbital_period / time_period """
@@ -20,6 +29,17 @@ class OrbitalPeriod:
         else:
             return (2 * pi * norm(planet.pos) / norm(planet.velo))
 
+    @staticmethod
+    def calc_mean_motion(planet, sun):
+        """ 2 * pi / period of the Kepler orbit through the planet's position and velocity around the sun (vis-viva) """
+        if (planet.name == sun.name):
+            return 0
+        mu = planet.G * (sun.mass + planet.mass)
+        inverse_semi_major_axis = 2 / norm(planet.pos - sun.pos) - norm(planet.velo - sun.velo) ** 2 / mu
+        if (inverse_semi_major_axis <= 0):    # Not on a closed orbit
+            return 0
+        return sqrt(mu * inverse_semi_major_axis ** 3)
+
     def get_relative_periods(self):
         """ Get the relative orbital periods of other planets to earth: (planet_orbital_period / earth_orbital_period)"""
         earth_orbital_period = self.calc_orbital_period(self.solar.get_planet("Earth"))
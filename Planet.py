@@ -9,9 +9,57 @@ class Planet:
         self.G = g
         self.name = name
         self.mass = mass
-        self.pos = pos
-        self.velo = velo
-        self.current_accel = np.array([0, 0])
-        self.previous_accel = np.array([0, 0])
+        self._pos = np.array(pos, dtype=float)
+        self._velo = np.array(velo, dtype=float)
+        self._current_accel = np.zeros(2)
+        self._previous_accel = np.zeros(2)
         self.radius = radius
         self.colour = colour
+
+    def bind(self, pos, velo, current_accel, previous_accel, copy=True):
+        """
+        Copies the planet's state into rows of a Solar system's arrays and becomes a view onto those rows
+        copy=False: the rows already hold the planet's state
+        """
+        if copy:
+            pos[...] = self._pos
+            velo[...] = self._velo
+            current_accel[...] = self._current_accel
+            previous_accel[...] = self._previous_accel
+        self._pos = pos
+        self._velo = velo
+        self._current_accel = current_accel
+        self._previous_accel = previous_accel
+
+    # Assignments write into the bound rows so the Solar arrays and the Planet never go out of sync
+    @property
+    def pos(self):
+        return self._pos
+
+    @pos.setter
+    def pos(self, value):
+        self._pos[...] = value
+
+    @property
+    def velo(self):
+        return self._velo
+
+    @velo.setter
+    def velo(self, value):
+        self._velo[...] = value
+
+    @property
+    def current_accel(self):
+        return self._current_accel
+
+    @current_accel.setter
+    def current_accel(self, value):
+        self._current_accel[...] = value
+
+    @property
+    def previous_accel(self):
+        return self._previous_accel
+
+    @previous_accel.setter
+    def previous_accel(self, value):
+        self._previous_accel[...] = value
@@ -0,0 +1,146 @@
+"""
+Profiler - Optional per-phase timing of a Solar simulation and the experiments, exported as a summary or as a
+Chrome trace (open it in chrome://tracing or https://ui.perfetto.dev)
+Off by default: Solar.run_sim only checks whether a profiler is set, and Solar.phase returns a shared no-op
+context when it is not
+"""
+
+import tracemalloc
+import threading
+import json
+import time
+import os
+
+
+class NullPhase:
+    """ The phase used when profiling is off """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_PHASE = NullPhase()
+NEW_PROFILER = object()     # The default of Solar.profile, which starts a new Profiler
+
+
+class Phase:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.start(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.stop()
+        return False
+
+
+class Profiler:
+    def __init__(self, trace_allocations=False, max_events=1000000):
+        """
+        trace_allocations: also records the memory allocated in every phase, with tracemalloc (which is slow)
+        max_events: the most phases kept for the trace, later ones only count towards the summary
+        """
+        self.trace_allocations = trace_allocations
+        self.max_events = max_events
+        self.events = []
+        self.dropped_events = 0
+        self.totals = {}    # name: [calls, total seconds, self seconds, net bytes, peak bytes]
+        self.counters = {}
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def phase(self, name):
+        return Phase(self, name)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def start(self, name):
+        """ Frames are [name, start time, time in nested phases, traced memory at the start, peak traced memory] """
+        current = None
+        if self.trace_allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            stack = self._stack()
+            if stack:   # Keeps the peak of the enclosing phase before the peak is reset for this one
+                stack[-1][4] = max(stack[-1][4], peak)
+            tracemalloc.reset_peak()
+        self._stack().append([name, time.perf_counter(), 0.0, current, current or 0])
+
+    def stop(self):
+        end = time.perf_counter()
+        stack = self._stack()
+        name, started, child_time, memory, peak = stack.pop()
+        duration = end - started
+        net = peak_bytes = 0
+        if memory is not None:
+            current, traced_peak = tracemalloc.get_traced_memory()
+            peak = max(peak, traced_peak)
+            net = current - memory
+            peak_bytes = peak - memory
+            if stack:
+                stack[-1][4] = max(stack[-1][4], peak)
+        if stack:
+            stack[-1][2] += duration
+        with self._lock:
+            totals = self.totals.setdefault(name, [0, 0.0, 0.0, 0, 0])
+            totals[0] += 1
+            totals[1] += duration
+            totals[2] += duration - child_time
+            totals[3] += net
+            totals[4] = max(totals[4], peak_bytes)
+            if len(self.events) < self.max_events:
+                event = {"name": name, "ph": "X", "ts": (started - self._origin) * 1e6, "dur": duration * 1e6,
+                         "pid": os.getpid(), "tid": threading.get_ident()}
+                if memory is not None:
+                    event["args"] = {"net_bytes": net, "peak_bytes": peak_bytes}
+                self.events.append(event)
+            else:
+                self.dropped_events += 1
+
+    def count(self, name, value):
+        """ Records the current value of a counter, e.g. the number of force evaluations so far """
+        with self._lock:
+            self.counters[name] = value
+            if len(self.events) < self.max_events:
+                self.events.append({"name": name, "ph": "C", "ts": (time.perf_counter() - self._origin) * 1e6,
+                                    "pid": os.getpid(), "args": {name: value}})
+            else:
+                self.dropped_events += 1
+
+    def summary(self):
+        """ Calls, total and self time (time not spent in nested phases) and allocations of every phase """
+        phases = {}
+        for name, (calls, total, own, net, peak) in sorted(self.totals.items(), key=lambda item: -item[1][2]):
+            phases[name] = {"calls": calls, "total_s": total, "self_s": own, "mean_us": total / calls * 1e6}
+            if self.trace_allocations:
+                phases[name].update({"net_bytes": net, "peak_bytes": peak})
+        return {"phases": phases, "counters": dict(self.counters), "dropped_events": self.dropped_events}
+
+    def print_summary(self):
+        print("Phase".ljust(30) + "Calls".rjust(10) + "Total (s)".rjust(12) + "Self (s)".rjust(12) +
+              "Mean (us)".rjust(12))
+        for name, phase in self.summary()["phases"].items():
+            print(name.ljust(30) + str(phase["calls"]).rjust(10) + ("%.4f" % phase["total_s"]).rjust(12) +
+                  ("%.4f" % phase["self_s"]).rjust(12) + ("%.2f" % phase["mean_us"]).rjust(12))
+        for name, value in self.counters.items():
+            print(name + ": " + str(value))
+
+    def save_summary(self, path):
+        with open(path, "w") as summary_file:
+            json.dump(self.summary(), summary_file, indent=2)
+
+    def save_trace(self, path):
+        """ Chrome trace event format, one complete event per phase and one counter event per count """
+        with open(path, "w") as trace_file:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, trace_file)
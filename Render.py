@@ -0,0 +1,148 @@
+"""
+Render - Draws a recorded Trajectory offline into a PNG frame sequence on worker processes, and joins the frames into
+a video when ffmpeg is installed, so long animations can be made on a server without a display
+    python Render.py --trajectory run.traj --output frames [--video run.mp4 --fps 30]
+    python Render.py --years 12 --steps-per-frame 4 --output frames --video solar.mp4     Simulates first
+Every worker memory-maps the trajectory itself and draws its own ranges of frames on its own Agg figure, so the
+frames per second grow with the cores and do not depend on how fast the simulation steps
+"""
+
+from Trajectory import Trajectory
+from Sweep import run_sweep
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import numpy as np
+import argparse
+import subprocess
+import shutil
+import os
+
+
+FRAME_NAME = "frame_%06d.png"
+DAY = 86400
+YEAR = 31557600
+
+
+def render_range(path, start, stop, every, directory, limit, size=(6, 6), dpi=100, marker_scale=1.0):
+    """
+    One worker's share: frames start, start + every, ... before stop, saved as FRAME_NAME % (frame // every)
+    The planets are markers of radius * marker_scale points, as the circles of Solar.run are smaller than a pixel at
+    the scale of the orbits, and test particles are green dots like the satellite of HohmannAnimation
+    """
+    trajectory = Trajectory(path)
+    figure = Figure(figsize=size, dpi=dpi)
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
+    ax.set_aspect("equal")
+    ax.set_xlim(-limit, limit)
+    ax.set_ylim(-limit, limit)
+    n = trajectory.n_massive
+    first = trajectory.positions[start]
+    sizes = (np.array(trajectory.header["radii"]) * marker_scale) ** 2
+    planets = ax.scatter(first[:n, 0], first[:n, 1], s=sizes, c=trajectory.header["colours"], zorder=2)
+    tests = ax.scatter(first[n:, 0], first[n:, 1], s=2, color="green") if trajectory.n_bodies > n else None
+    title = ax.set_title("")
+    for i in range(start, stop, every):
+        frame = trajectory.positions[i]
+        planets.set_offsets(frame[:n])
+        if tests is not None:
+            tests.set_offsets(frame[n:])
+        title.set_text("Simulation of the Solar System, day " + str(int(trajectory.times[i] // DAY)))
+        figure.savefig(os.path.join(directory, FRAME_NAME % (i // every)))
+    return len(range(start, stop, every))
+
+
+def frame_limit(trajectory, frame=0):
+    """ The half width of the view, 15% beyond the farthest planet like Solar.run """
+    return 1.15 * float(np.max(np.linalg.norm(trajectory.positions[frame, :trajectory.n_massive], axis=1)))
+
+
+def render_frames(path, directory, every=1, workers=None, ranges_per_worker=4, limit=None, **style):
+    """
+    Renders every `every`th frame of the trajectory file into directory, split into contiguous ranges of frames
+    across the workers (a few ranges each, so a worker with slower frames does not hold up the end)
+    style: size (inches), dpi and marker_scale for render_range. Returns the number of frames written
+    """
+    os.makedirs(directory, exist_ok=True)
+    trajectory = Trajectory(path)
+    workers = workers or os.cpu_count() or 1
+    count = len(range(0, len(trajectory), every))
+    limit = frame_limit(trajectory) if limit is None else limit
+    bounds = np.linspace(0, count, min(count, workers * ranges_per_worker) + 1).astype(int) * every
+    tasks = [dict(style, path=os.path.abspath(path), start=int(start), stop=int(stop), every=every,
+                  directory=os.path.abspath(directory), limit=limit)
+             for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+    if workers == 1:
+        for task in tasks:
+            render_range(**task)
+        return count
+    for result in run_sweep(render_range, tasks, max_workers=workers, progress=None):
+        if result.error is not None:
+            raise RuntimeError("Rendering frames " + str(result.params["start"]) + " to " +
+                               str(result.params["stop"]) + " failed: " + result.error)
+    return count
+
+
+def encode_video(directory, path, fps=30, ffmpeg=None):
+    """
+    Joins the frames of directory into a video with ffmpeg (H.264 for .mp4, .mov and .mkv, otherwise whatever ffmpeg
+    uses for the extension, e.g. .gif), returns the path, or None when ffmpeg is not installed
+    """
+    ffmpeg = ffmpeg or shutil.which("ffmpeg")
+    if ffmpeg is None:
+        return None
+    command = [ffmpeg, "-y", "-loglevel", "error", "-framerate", str(fps), "-i", os.path.join(directory, FRAME_NAME)]
+    if os.path.splitext(path)[1].lower() in (".mp4", ".mov", ".mkv"):
+        # H.264 in yuv420p plays everywhere, but needs even frame sizes
+        command += ["-c:v", "libx264", "-pix_fmt", "yuv420p", "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"]
+    subprocess.run(command + [path], check=True)
+    return path
+
+
+def simulate(path, end_time, steps_per_frame=1, timestep=100000, integrator=None, scenario=None, jupiter=True):
+    """ Records a new run of the Solar system up to end_time (s) into the trajectory file, a frame every few steps """
+    from Solar import Solar
+    solar = Solar(timestep=timestep, integrator=integrator, scenario=scenario)
+    if not jupiter:
+        solar.planets = solar.planets[:-1]
+    recorder = solar.record(path, every=steps_per_frame)
+    solar.run_until(end_time)
+    recorder.close(solar)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Renders a Solar simulation to PNG frames and video without a display")
+    parser.add_argument("--trajectory", help="a recorded trajectory file, otherwise a new run is simulated into "
+                                             "<output>/trajectory.bin")
+    parser.add_argument("--output", default="frames", help="the directory the frames are written to")
+    parser.add_argument("--video", help="also joins the frames into this video file, if ffmpeg is installed")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--every", type=int, default=1, help="renders every n-th recorded frame")
+    parser.add_argument("--workers", type=int, help="rendering processes (default: one per core)")
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--size", type=float, default=6, help="frame width and height in inches")
+    parser.add_argument("--years", type=float, default=2, help="length of a new run")
+    parser.add_argument("--steps-per-frame", type=int, default=1, help="steps of a new run between two frames")
+    parser.add_argument("--timestep", type=float, default=100000, help="of a new run")
+    parser.add_argument("--integrator", help="of a new run, any name from Integrators.INTEGRATORS")
+    parser.add_argument("--scenario", help="the CSV or catalog file of the bodies of a new run")
+    parser.add_argument("--no-jupiter", action="store_true", help="leaves Jupiter out of a new run")
+    args = parser.parse_args()
+
+    path = args.trajectory
+    if path is None:
+        os.makedirs(args.output, exist_ok=True)
+        path = simulate(os.path.join(args.output, "trajectory.bin"), args.years * YEAR, args.steps_per_frame,
+                        args.timestep, args.integrator, args.scenario, not args.no_jupiter)
+    count = render_frames(path, args.output, args.every, args.workers, size=(args.size, args.size), dpi=args.dpi)
+    print(str(count) + " frames written to " + args.output)
+    if args.video:
+        if encode_video(args.output, args.video, args.fps) is None:
+            print("ffmpeg is not installed, so no video was made (the frames are kept)")
+        else:
+            print("Video written to " + args.video)
+
+
+if __name__ == "__main__":
+    main()
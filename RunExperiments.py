@@ -4,10 +4,18 @@ from DoomsdayPlanetaryAlignment import DoomsdayPlanetaryAlignment
 from HohmannAnimation import HohmannAnimation
 from Hohmann import Hohmann
 from Solar import Solar
+from Sweep import run_sweep
 import math
+import os
 import matplotlib.pyplot as plt
 
 
+def hohmann_distances(angles, snapshot=None):
+    """ One chunk of experiment 5, returns the closest distance to Mars (km) for each launch angle (degrees) """
+    hohmann = Hohmann(snapshot, adaptive=True)
+    return hohmann.satellite_sweep([angle * math.pi / 180.0 for angle in angles])[:, 0].tolist()
+
+
 def main():
     print("Enter 1 for the Energy Conservation Graph")
     print("Enter 2 for the Orbital Periods results to be written to \"orbital_periods.txt\"")
@@ -20,7 +28,7 @@ def main():
     print("Enter 6 for the animation of the Solar System (with or without Jupiter)")
     print("Enter 7 for the Energy Conservation Graph using the Direct Euler method")
     print("Enter 0 to Exit")
-    print("Note that 3 and 5 are very very slow and take hours to compute the results")
+    print("Note that 3 and 5 are slow, 5 is spread across all CPU cores")
 
     while True:
         experiment = int(input("Which experiment do you want to see? "))
@@ -33,17 +41,11 @@ def main():
             o.write_orbital_periods()
 
         elif (experiment == 3):
-            print("This will take a long time to load")
-            print("If you want to check it, "
-                  "bump it up to range(30, 51, 5) or above (with large intervals) to save time instead")
-            print("FYI running range(5, 61, 1) takes around 3-4 hours (See results in doomsday_alignment.txt)")
-            alignment_angles = []
-            alignment_years = []
-            for threshold in range(10, 61, 5):
-                p = DoomsdayPlanetaryAlignment(threshold)
-                angle, year = p.write_alignment_year()
-                alignment_angles.append(angle)
-                alignment_years.append(year)
+            print("This will take a while to load, all the thresholds are checked in one simulation")
+            print("It runs until the smallest threshold is reached (See results in doomsday_alignment.txt)")
+            alignments = DoomsdayPlanetaryAlignment().write_alignment_years(range(10, 61, 5))
+            alignment_angles = [angle for angle, year in alignments]
+            alignment_years = [year for angle, year in alignments]
             plt.plot(alignment_angles, alignment_years)
             plt.xlabel("Threshold")
             plt.ylabel("Alignment Year")
@@ -63,18 +65,23 @@ def main():
             ha.run_sim()
 
         elif (experiment == 5):
-            satellite_angles = []
-            satellite_distances = []
-            g = Hohmann()
+            g = Hohmann(adaptive=True)
             g.get_ideal_angle()
             g.get_initial_velocity()
             g.get_satellite_orbital_period()
-            print("It will take some time to compute data for the graph, maybe a few hours.")
-            for i in range(40, 51):
-                h = Hohmann()
-                angle, distance = h.satellite_sim(i * math.pi / 180.0)
-                satellite_angles.append(i)
-                satellite_distances.append(distance)
+            print("It will take some time to compute data for the graph.")
+            # Every worker flies its share of the launch angles as massless satellites in a single simulation
+            # The two years before the launch window are the same for every angle, so they are simulated once
+            warm_start = g.warm_up()
+            satellite_angles = list(range(40, 51))
+            workers = min(os.cpu_count() or 1, len(satellite_angles))
+            chunks = [{"angles": satellite_angles[i::workers], "snapshot": warm_start} for i in range(workers)]
+            distances = {}
+            for result in run_sweep(hohmann_distances, chunks):
+                if result.error is None:
+                    distances.update(zip(result.params["angles"], result.value))
+            satellite_angles = sorted(distances)
+            satellite_distances = [distances[angle] for angle in satellite_angles]
             print(satellite_angles)
             print(satellite_distances)
             plt.plot(satellite_angles, satellite_distances)
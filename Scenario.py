@@ -0,0 +1,160 @@
+"""
+Scenario - The initial state of a simulation, parsed once into read-only arrays and shared by every Solar
+Scenarios are read from the input_params.txt CSV format (name, mass, x, y, vx, vy, radius, colour) in chunks of
+rows, or from a binary columnar catalog that is memory-mapped, and cached by path and modification time
+Catalog layout: an 8 byte magic, the header length (uint64), a JSON header with the columns and their offsets, then
+every column as a contiguous array starting on a 64 byte boundary
+"""
+
+from Planet import Planet
+import itertools
+import hashlib
+import json
+import os
+import numpy as np
+
+
+CATALOG_MAGIC = b"ORBCAT01"
+ALIGNMENT = 64
+COLUMNS = ("names", "masses", "positions", "velocities", "radii", "colours")
+
+_cache = {}
+
+
+class Scenario:
+    """ Read-only arrays with one row per body, a Solar copies them into its own state """
+    def __init__(self, names, masses, positions, velocities, radii, colours):
+        self.names = names
+        self.masses = masses
+        self.positions = positions
+        self.velocities = velocities
+        self.radii = radii
+        self.colours = colours
+        for column in COLUMNS:
+            array = getattr(self, column)
+            if array.flags.writeable:
+                array.flags.writeable = False
+        self._indices = None
+        self._digest = None
+
+    def __len__(self):
+        return len(self.masses)
+
+    def __repr__(self):
+        return "Scenario(bodies=" + str(len(self)) + ")"
+
+    def index(self, name):
+        if self._indices is None:
+            self._indices = {}
+            for i, body in enumerate(self.names.tolist()):
+                self._indices.setdefault(body, i)
+        return self._indices[name]
+
+    def digest(self):
+        """ A SHA-256 of the contents, the same for a CSV and a catalog of the same bodies """
+        if self._digest is None:
+            sha = hashlib.sha256()
+            for column in COLUMNS:
+                array = np.ascontiguousarray(getattr(self, column))
+                sha.update(column.encode() + str(array.shape).encode())
+                if array.dtype.kind == "U":
+                    sha.update("\0".join(array.tolist()).encode())
+                else:
+                    sha.update(array.astype("<f8").tobytes())
+            self._digest = sha.hexdigest()
+        return self._digest
+
+    def planet(self, i, g):
+        """ A new Planet with the initial state of row i (or the named body) """
+        if isinstance(i, str):
+            i = self.index(i)
+        return Planet(g, str(self.names[i]), float(self.masses[i]), self.positions[i], self.velocities[i],
+                      float(self.radii[i]), str(self.colours[i]))
+
+    def planets(self, g):
+        return [self.planet(i, g) for i in range(len(self))]
+
+
+def read_csv(path, chunk_rows=65536):
+    """ Parses the CSV a chunk of rows at a time, straight into arrays """
+    names, numbers, colours = [], [], []
+    with open(path) as planet_data:
+        while True:
+            lines = [line for line in itertools.islice(planet_data, chunk_rows) if line.strip()]
+            if not lines:
+                break
+            numbers.append(np.loadtxt(lines, delimiter=",", usecols=range(1, 7), ndmin=2))
+            text = np.loadtxt(lines, delimiter=",", usecols=(0, 7), dtype=str, ndmin=2)
+            names.append(text[:, 0])
+            colours.append(text[:, 1])
+    if not numbers:
+        raise ValueError(str(path) + " has no bodies")
+    numbers = np.concatenate(numbers)
+    return Scenario(np.concatenate(names), numbers[:, 0].copy(), numbers[:, 1:3].copy(), numbers[:, 3:5].copy(),
+                    numbers[:, 5].copy(), np.concatenate(colours))
+
+
+def save_catalog(scenario, path):
+    """ Writes the scenario as a binary columnar catalog, through a temporary file like Snapshot.save """
+    columns = []
+    offset = 0
+    header = {"n_bodies": len(scenario), "columns": columns}
+    for name in COLUMNS:
+        array = np.ascontiguousarray(getattr(scenario, name))
+        columns.append({"name": name, "dtype": array.dtype.str, "shape": list(array.shape), "offset": offset})
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header_bytes = json.dumps(header).encode()
+    data_offset = -(-(len(CATALOG_MAGIC) + 8 + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as catalog_file:
+        catalog_file.write(CATALOG_MAGIC + np.array([len(header_bytes)], dtype=np.uint64).tobytes() + header_bytes)
+        for column in columns:
+            catalog_file.seek(data_offset + column["offset"])
+            catalog_file.write(np.ascontiguousarray(getattr(scenario, column["name"])).tobytes())
+        catalog_file.truncate(data_offset + offset)
+    os.replace(temp_path, path)
+
+
+def read_catalog(path):
+    """ Memory-maps every column of a catalog read-only, so only the rows that are used are ever read """
+    with open(path, "rb") as catalog_file:
+        prefix = catalog_file.read(len(CATALOG_MAGIC) + 8)
+        if prefix[:len(CATALOG_MAGIC)] != CATALOG_MAGIC:
+            raise ValueError(str(path) + " is not a scenario catalog")
+        header_length = int(np.frombuffer(prefix[len(CATALOG_MAGIC):], dtype=np.uint64)[0])
+        header = json.loads(catalog_file.read(header_length))
+    data_offset = -(-(len(CATALOG_MAGIC) + 8 + header_length) // ALIGNMENT) * ALIGNMENT
+    arrays = {}
+    for column in header["columns"]:
+        shape = tuple(column["shape"])
+        if 0 in shape:
+            arrays[column["name"]] = np.zeros(shape, dtype=column["dtype"])
+        else:
+            arrays[column["name"]] = np.memmap(path, dtype=column["dtype"], mode="r",
+                                               offset=data_offset + column["offset"], shape=shape)
+    return Scenario(*(arrays[name] for name in COLUMNS))
+
+
+def is_catalog(path):
+    with open(path, "rb") as scenario_file:
+        return scenario_file.read(len(CATALOG_MAGIC)) == CATALOG_MAGIC
+
+
+def load_scenario(path="input_params.txt"):
+    """
+    The scenario in a CSV or catalog file, parsed only the first time it is asked for and again when the file changes
+    A Scenario passed in is returned as it is
+    """
+    if isinstance(path, Scenario):
+        return path
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if key not in _cache:
+        for old_key in [old_key for old_key in _cache if old_key[0] == key[0]]:
+            del _cache[old_key]
+        _cache[key] = read_catalog(path) if is_catalog(path) else read_csv(path)
+    return _cache[key]
+
+
+def clear_cache():
+    _cache.clear()
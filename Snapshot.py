@@ -0,0 +1,55 @@
+"""
+Snapshot - The full integrator state of a Solar system at one moment, to restore, fork or resume a simulation
+Snapshots are saved as a single uncompressed .npz file, so loading one is a handful of binary array reads
+"""
+
+import numpy as np
+import json
+import os
+
+
+class Snapshot:
+    def __init__(self, names, masses, radii, colours, positions, velocities, current_accels, previous_accels,
+                 n_massive, time_passed, timestep, integrator, g, integrator_options=None, integrator_state=None):
+        self.names = list(names)
+        self.masses = masses
+        self.radii = radii
+        self.colours = list(colours)
+        self.positions = positions
+        self.velocities = velocities
+        self.current_accels = current_accels
+        self.previous_accels = previous_accels
+        self.n_massive = int(n_massive)     # Rows after the planets are massless test particles
+        self.time_passed = time_passed
+        self.timestep = timestep
+        self.integrator = str(integrator)
+        self.integrator_options = dict(integrator_options or {})     # e.g. the tolerance of dopri5
+        self.integrator_state = dict(integrator_state or {})    # e.g. the levels of block timesteps
+        self.G = g
+
+    def __repr__(self):
+        return "Snapshot(time_passed=" + str(self.time_passed) + ", bodies=" + str(len(self.positions)) + ")"
+
+    def save(self, path):
+        """ Writes to a temporary file first, so an interrupted save never leaves a broken checkpoint behind """
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as snapshot_file:
+            np.savez(snapshot_file, names=np.array(self.names), masses=self.masses, radii=self.radii,
+                     colours=np.array(self.colours), positions=self.positions, velocities=self.velocities,
+                     current_accels=self.current_accels, previous_accels=self.previous_accels,
+                     n_massive=self.n_massive, time_passed=self.time_passed, timestep=self.timestep,
+                     integrator=self.integrator, g=self.G, integrator_options=json.dumps(self.integrator_options),
+                     **{"integrator_state_" + name: array for name, array in self.integrator_state.items()})
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def load(path):
+        with np.load(path) as data:
+            # Snapshots saved before the options were kept resume with the default options
+            options = json.loads(data["integrator_options"].item()) if "integrator_options" in data else {}
+            state = {name[len("integrator_state_"):]: data[name] for name in data.files
+                     if name.startswith("integrator_state_")}
+            return Snapshot(data["names"].tolist(), data["masses"], data["radii"], data["colours"].tolist(),
+                            data["positions"], data["velocities"], data["current_accels"], data["previous_accels"],
+                            data["n_massive"], data["time_passed"].item(), data["timestep"].item(),
+                            data["integrator"].item(), data["g"].item(), options, state)
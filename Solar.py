@@ -3,80 +3,410 @@ Solar Class - The class that holds the simulation of the Solar System
 """
 
 from Planet import Planet
+from Forces import make_force_backend
+from Snapshot import Snapshot
+from Events import EventState, state_at
+from Integrators import make_integrator
+from Kepler import state_to_elements, elements_to_state, kepler_drift
+from Trajectory import TrajectoryRecorder
+from Animation import LiveAnimation
+from Render import render_frames, encode_video
+from Profiler import Profiler, NULL_PHASE, NEW_PROFILER
+from Scenario import load_scenario, COLUMNS
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
-import csv
 import math
+import os
 
 
 class Solar:
-    def __init__(self, timestep=100000):
+    def __init__(self, timestep=100000, force="auto", theta=0.5, snapshot=None, integrator=None, scenario=None,
+                 **options):
+        """
+        force: "direct", "barnes-hut" or "auto" (direct summation for small systems), theta: Barnes-Hut opening
+        snapshot: starts from a saved Snapshot instead of reading input_params.txt
+        scenario: a Scenario, or the CSV or catalog file to load one from (default input_params.txt)
+        integrator: a name from Integrators.INTEGRATORS (default "beeman", or the snapshot's with its options),
+        options go to it
+        """
+        if integrator is None and snapshot is not None:
+            integrator = snapshot.integrator
+            options = dict(snapshot.integrator_options, **options)
+        elif integrator is None:
+            integrator = "beeman"
+        self.integrator = make_integrator(integrator, **options)
         self.G = 6.6743E-11
-        self.planets = []
-        with open("input_params.txt") as planet_data:
-            csv_reader = csv.reader(planet_data)
-            for planet in csv_reader:
-                name = str(planet[0])
-                mass = float(planet[1])
-                pos = np.array([float(planet[2]), float(planet[3])])
-                velo = np.array([float(planet[4]), float(planet[5])])
-                radius = float(planet[6])  # Not the actual radius, for animation purposes only
-                colour = str(planet[7])
-                self.planets.append(Planet(self.G, name, mass, pos, velo, radius, colour))
+        self.force_name = force
+        self.theta = theta
+        self.force = None
+        self.n_massive = 0
+        self.n_test = 0
+        self._new_tests = None
+        self.events = []
+        self.event_log = []
+        self.stop_event = None
+        self._event_states = []     # The states at the end of the last (up to) three steps
+        self.hooks = []
+        self.force_evaluations = 0
+        self.body_evaluations = 0   # Accelerations of single bodies, which block timesteps only calculate for some
+        self.profiler = None
+        self.scenario = None
+        self._planets = None
+        self._indices = None
+        if snapshot is not None:
+            self.restore(snapshot)
+            return
+        self.scenario = load_scenario("input_params.txt" if scenario is None else scenario)
         self.timestep = timestep
         self.time_passed = 0
+        self._build_state([getattr(self.scenario, column) for column in COLUMNS])
+
+    @property
+    def planets(self):
+        """ A Planet for every massive body, made on first use as views onto their rows of the state arrays """
+        if self._planets is None:
+            self._planets = []
+            for i in range(self.n_massive):
+                planet = Planet(self.G, str(self.names[i]), float(self.masses[i]), self.positions[i],
+                                self.velocities[i], float(self.radii[i]), str(self.colours[i]))
+                planet.bind(self.positions[i], self.velocities[i], self.current_accels[i], self.previous_accels[i],
+                            copy=False)
+                self._planets.append(planet)
+        return self._planets
+
+    @planets.setter
+    def planets(self, planets):
+        """ Replacing the planets (e.g. removing Jupiter) rebuilds the arrays that hold the state """
+        self._planets = list(planets)
+        self._build_state()
+
+    def add_planet(self, planet):
+        self.planets.append(planet)
+        self._build_state()
+
+    def _check_planets(self):
+        """ Takes planets appended to or removed from the planets list directly into the arrays """
+        if self._planets is not None and len(self._planets) != self.n_massive:
+            self._build_state()
+
+    def add_test_particles(self, positions, velocities, launch_time=None):
+        """
+        Adds massless test particles (e.g. satellites) that feel the gravity of the planets but exert none
+        launch_time: a time within the last step (e.g. the refined time of an event) the given state belongs to,
+        the particles are then carried forward to time_passed through the interpolated motion of the planets
+        Returns the indices of the new particles in test_positions / test_velocities
+        """
+        positions, velocities = np.atleast_2d(positions).astype(float), np.atleast_2d(velocities).astype(float)
+        if launch_time is not None and launch_time < self.time_passed and len(self._event_states) >= 2:
+            positions, velocities = self._catch_up(positions, velocities, launch_time)
+        self._new_tests = (positions, velocities)
+        first = self.n_test
+        self._build_state()
+        return np.arange(first, self.n_test)
+
+    def _catch_up(self, positions, velocities, start_time, substeps=16):
+        """ Leapfrogs new test particles from start_time to time_passed under the interpolated planets' gravity """
+        gm = self.G * self.masses
+
+        def accels(pos, time):
+            planet_pos = state_at(self._event_states, time).positions[:self.n_massive]
+            s = planet_pos[np.newaxis, :, :] - pos[:, np.newaxis, :]
+            mag_squared = np.einsum("ijk,ijk->ij", s, s)
+            mag_squared[mag_squared == 0] = np.inf
+            return np.einsum("ij,ijk->ik", gm / (mag_squared ** 1.5), s)
+
+        h = (self.time_passed - start_time) / substeps
+        time = start_time
+        accel = accels(positions, time)
+        for _ in range(substeps):
+            velocities = velocities + accel * (h / 2)
+            positions = positions + velocities * h
+            time += h
+            accel = accels(positions, time)
+            velocities = velocities + accel * (h / 2)
+        return positions, velocities
+
+    def add_event(self, event):
+        """ Checks the event after every step, detected events are appended to event_log """
+        if not self._event_states:
+            self._record_event_state()
+        self.events.append(event)
+
+    def _record_event_state(self):
+        state = EventState(self.time_passed, self.positions.copy(), self.velocities.copy())
+        self._event_states = (self._event_states + [state])[-3:]
+
+    def _check_events(self):
+        self._record_event_state()
+        for event in self.events:
+            for record in event.check(self._event_states):
+                self.event_log.append(record)
+                if event.terminal and self.stop_event is None:
+                    self.stop_event = record
+
+    def add_hook(self, hook):
+        """ hook(solar) is called after every step, e.g. a TrajectoryRecorder """
+        self.hooks.append(hook)
+
+    def record(self, path, every=1, chunk_bytes=32 * 2 ** 20):
+        """ Streams the state every `every` steps into a trajectory file, close() the returned recorder at the end """
+        return TrajectoryRecorder(path, every, chunk_bytes).attach(self)
+
+    def run_until(self, end_time):
+        """ Runs until end_time or a terminal event, and returns that terminal event (None if there was none) """
+        self.stop_event = None
+        while self.time_passed < end_time:
+            self.run_sim()
+            if self.stop_event is not None:
+                return self.stop_event
+        return None
+
+    def fast_forward(self, dt):
+        """
+        Jumps dt seconds ahead with every body on its Kepler orbit around the most massive one, leaving out the pulls
+        between the others: exact for a single planet, and a quick warm-up or initial guess for Sun-dominated systems
+        """
+        n = self.n_massive
+        central = int(np.argmax(self.masses))
+        others = np.arange(len(self.positions)) != central
+        total_mass = np.sum(self.masses)
+        other_masses = np.zeros(len(self.positions) - 1)
+        other_masses[:n - 1] = np.delete(self.masses, central)
+        barycentre = np.einsum("i,ij->j", self.masses, self.positions[:n]) / total_mass
+        barycentre_velo = np.einsum("i,ij->j", self.masses, self.velocities[:n]) / total_mass
+
+        q = self.positions[others] - self.positions[central]
+        v = self.velocities[others] - self.velocities[central]
+        mu = self.G * (self.masses[central] + other_masses)
+        bound = 2 / np.linalg.norm(q, axis=1) - np.einsum("ij,ij->i", v, v) / mu > 0
+        elements = state_to_elements(q[bound], v[bound], mu[bound])
+        q[bound], v[bound] = elements_to_state(elements, mu[bound], dt)
+        if not np.all(bound):   # Escaping bodies, e.g. a fast test particle
+            q[~bound], v[~bound] = kepler_drift(q[~bound], v[~bound], mu[~bound], dt)
+
+        central_pos = barycentre + barycentre_velo * dt - np.einsum("i,ij->j", other_masses, q) / total_mass
+        central_velo = barycentre_velo - np.einsum("i,ij->j", other_masses, v) / total_mass
+        self.positions[central] = central_pos
+        self.positions[others] = q + central_pos
+        self.velocities[central] = central_velo
+        self.velocities[others] = v + central_velo
+        self.time_passed += dt
+        # Multi-step integrators start over from the new state, like at the start of a run
+        self.calc_accels(self.positions, self.current_accels)
+        self.previous_accels[...] = self.current_accels
+        self.integrator.reset()
+        self._event_states = []
+        for event in self.events:
+            event.values = []
+        if self.events:
+            self._record_event_state()
+
+    def snapshot(self):
+        """ Copies the full integrator state, including test particles, accelerations, time passed and timestep """
+        self._check_planets()
+        return Snapshot(self.names.tolist(), self.masses.copy(), self.radii.copy(), self.colours.tolist(),
+                        self.positions.copy(), self.velocities.copy(),
+                        self.current_accels.copy(), self.previous_accels.copy(), self.n_massive, self.time_passed,
+                        self.timestep, self.integrator.name, self.G, self.integrator.options, self.integrator.state())
+
+    def restore(self, snapshot):
+        """ Returns to a snapshot, in place when the bodies are the same and by rebuilding the planets otherwise """
+        self._check_planets()
+        same_bodies = (self.n_massive == snapshot.n_massive and len(self.positions) == len(snapshot.positions) and
+                       self.names.tolist() == snapshot.names)
+        if not same_bodies:
+            self.G = snapshot.G
+            self.n_test = 0
+            n = snapshot.n_massive
+            self._new_tests = (snapshot.positions[n:], snapshot.velocities[n:])
+            self._build_state((snapshot.names, snapshot.masses, snapshot.positions[:n], snapshot.velocities[:n],
+                               snapshot.radii, snapshot.colours))
+        self.positions[...] = snapshot.positions
+        self.velocities[...] = snapshot.velocities
+        self.current_accels[...] = snapshot.current_accels
+        self.previous_accels[...] = snapshot.previous_accels
+        self.time_passed = snapshot.time_passed
+        self.timestep = snapshot.timestep
+        # What the integrator carries between steps belongs to the snapshot, or starts over with another integrator
+        self.integrator.set_state(snapshot.integrator_state if snapshot.integrator == self.integrator.name else {})
+        self._event_states = []    # Events start over from the restored state
+        for event in self.events:
+            event.values = []
+        if self.events:
+            self._record_event_state()
+
+    def fork(self):
+        """ An independent copy of this system that continues from the current state """
+        return Solar(force=self.force_name, theta=self.theta, snapshot=self.snapshot())
+
+    def save_snapshot(self, path):
+        self.snapshot().save(path)
+
+    @classmethod
+    def load_snapshot(cls, path, force="auto", theta=0.5):
+        """ Resumes a simulation that was saved with save_snapshot """
+        return cls(force=force, theta=theta, snapshot=Snapshot.load(path))
+
+    @property
+    def test_positions(self):
+        return self.positions[self.n_massive:]
+
+    @property
+    def test_velocities(self):
+        return self.velocities[self.n_massive:]
+
+    def _build_state(self, bodies=None):
+        """
+        Stores the masses, positions, velocities and accelerations of all planets in contiguous (N, 2) arrays
+        Each Planet then becomes a view onto its own row, and all the workspaces for a step are allocated here once
+        The K test particles are kept in the rows after the N planets, so the arrays are really (N + K, 2)
+        bodies: the columns (names, masses, positions, velocities, radii, colours) of new planets, e.g. of a Scenario,
+        which are copied in without making a Planet for each. Otherwise the planets list holds the planets once it
+        has been made, and the planets keep their rows while it has not
+        """
+        states = ()
+        if self.n_massive or self.n_test:
+            states = (self.positions, self.velocities, self.current_accels, self.previous_accels)
+        old_tests = [np.array(state[self.n_massive:]) for state in states] if self.n_test else []
+        old_planets = []
+        if bodies is not None:
+            self._planets = None
+            names, masses, positions, velocities, radii, colours = bodies
+            old_planets = [positions, velocities]
+        elif self._planets is not None:
+            names = [planet.name for planet in self._planets]
+            masses = [planet.mass for planet in self._planets]
+            radii = [planet.radius for planet in self._planets]
+            colours = [planet.colour for planet in self._planets]
+        else:   # Only the test particles change
+            names, masses, radii, colours = self.names, self.masses, self.radii, self.colours
+            old_planets = [np.array(state[:self.n_massive]) for state in states]
+        new_tests = self._new_tests
+        self._new_tests = None
+        k = self.n_test + (0 if new_tests is None else len(new_tests[0]))
+
+        self.names = np.array(names, dtype=str)
+        self.masses = np.array(masses, dtype=float)
+        self.radii = np.array(radii, dtype=float)
+        self.colours = np.array(colours, dtype=str)
+        n = len(self.masses)
+        self.positions = np.zeros((n + k, 2))
+        self.velocities = np.zeros((n + k, 2))
+        self.current_accels = np.zeros((n + k, 2))
+        self.previous_accels = np.zeros((n + k, 2))
+        states = (self.positions, self.velocities, self.current_accels, self.previous_accels)
+        if self._planets is not None:
+            for i, planet in enumerate(self._planets):
+                planet.bind(self.positions[i], self.velocities[i], self.current_accels[i], self.previous_accels[i])
+        for state, old in zip(states, old_planets):
+            state[:n] = old
+        for state, old in zip(states, old_tests):
+            state[n:n + self.n_test] = old
+        if new_tests is not None:
+            self.positions[n + self.n_test:] = new_tests[0]
+            self.velocities[n + self.n_test:] = new_tests[1]
+        first_new = n + self.n_test
+        self.n_massive = n
+        self.n_test = k
+        self._indices = None
+
+        backend = make_force_backend(self.force_name, n, self.theta)
+        if self.force is None or self.force.name != backend.name:
+            self.force = backend
+        self.force.set_masses(self.G * self.masses, n + k)
+        self.integrator.resize(self.positions.shape)
+        # Like the first update_pos of a run, the current accelerations are recalculated for the new set of planets
+        self.calc_accels(self.positions, self.current_accels)
+        # New test particles start over like perturbed Ensemble members, a zero previous acceleration would give their
+        # first Beeman step a kick of a * h / 6
+        self.previous_accels[first_new:] = self.current_accels[first_new:]
+
+    def calc_accels(self, positions, out, targets=None):
+        """
+        Calculates the accelerations of every body caused by all planets with the chosen force backend
+        targets: only the accelerations of these rows are calculated into out
+        """
+        self.force_evaluations += 1
+        self.body_evaluations += len(positions) if targets is None else len(targets)
+        if self.profiler is not None:
+            with self.profiler.phase("forces:" + self.force.name):
+                return self.force.accelerations(positions, out, targets)
+        return self.force.accelerations(positions, out, targets)
 
     def calc_force(self, p1):
         """ Calculates the total force applied on the given planet by other planets (Used for acceleration) """
-        total_force = np.array([0.0, 0.0])  # Must be floats to avoid adding floats to ints
-        for p2 in self.planets:
-            if (p1 != p2):
-                s = p2.pos - p1.pos
-                direction = self.normalise_vec(s)
-                mag_squared = np.linalg.norm(s) ** 2
-                if (mag_squared != 0):
-                    total_force += ((self.G * p1.mass * p2.mass) / mag_squared) * direction
-                else:
-                    total_force += np.zeros(2)
-        return total_force
-
-    def update_pos(self, planet):
-        """ Updates current acceleration for calculation of the next position """
-        planet.current_accel = self.calc_force(planet) / planet.mass
-        # The following is Beeman Formula 1
-        next_pos = planet.pos + (planet.velo * self.timestep) + \
-                   (1 / 6) * ((4 * planet.current_accel) - planet.previous_accel) * (self.timestep ** 2)
-        return next_pos
-
-    def update_velo(self, planet):
-        """ Calculates the next acceleration for the next velocity and Updates the accelerations """
-        next_accel = self.calc_force(planet) / planet.mass
-        # The following is Beeman Formula 2
-        next_velo = planet.velo + (1 / 6) * ((2 * next_accel) + (5 * planet.current_accel) - planet.previous_accel) * \
-                    self.timestep
-        planet.previous_accel = planet.current_accel
-        planet.current_accel = next_accel
-        return next_velo
+        s = self.positions[:self.n_massive] - p1.pos
+        mag_squared = np.einsum("ij,ij->i", s, s)
+        mag_squared[mag_squared == 0] = np.inf  # Ignores the planet itself
+        return self.G * p1.mass * np.einsum("i,ij->j", self.masses / (mag_squared ** 1.5), s)
+
+    @property
+    def accepted_steps(self):
+        return self.integrator.accepted_steps
+
+    @property
+    def rejected_steps(self):
+        return self.integrator.rejected_steps
+
+    def profile(self, profiler=NEW_PROFILER):
+        """ Times every phase of run_sim from now on (with a new Profiler unless one is given), None turns it off """
+        self.profiler = Profiler() if profiler is NEW_PROFILER else profiler
+        return self.profiler
+
+    def phase(self, name):
+        """ A context that times a phase of the work when profiling, e.g. with solar.phase("alignment check"): """
+        return NULL_PHASE if self.profiler is None else self.profiler.phase(name)
 
     def run_sim(self):
         """ Each simulation requires updating the positions and velocities of all planets """
-        self.time_passed += self.timestep
+        if self.profiler is not None:
+            return self._run_sim_profiled()
+        if self._planets is not None and len(self._planets) != self.n_massive:  # Planets appended to the list directly
+            self._build_state()
+        self.time_passed += self.integrator.step(self, self.timestep)
+        if self.events:
+            self._check_events()
+        for hook in self.hooks:
+            hook(self)
 
-        planet_coords = []
-        for i in range(len(self.planets)):  # Calculate the positions of the planets
-            planet_coords.append(self.update_pos(self.planets[i]))
-        for j in range(len(self.planets)):  # Update the positions of the planets for the animation
-            self.planets[j].pos = planet_coords[j]
-        for k in range(len(self.planets)):  # Calculates and Updates the velocities of the planets
-            self.planets[k].velo = self.update_velo(self.planets[k])
+    def _run_sim_profiled(self):
+        profiler = self.profiler
+        with profiler.phase("run_sim"):
+            if self._planets is not None and len(self._planets) != self.n_massive:
+                with profiler.phase("build_state"):
+                    self._build_state()
+            with profiler.phase("integrator:" + self.integrator.name):
+                self.time_passed += self.integrator.step(self, self.timestep)
+            if self.events:
+                with profiler.phase("events"):
+                    self._check_events()
+            for hook in self.hooks:
+                with profiler.phase("hook:" + type(hook).__name__):
+                    hook(self)
+        profiler.count("force_evaluations", self.force_evaluations)
+        profiler.count("body_evaluations", self.body_evaluations)
 
     def animate(self, i, patches):
         self.run_sim()
         for i in range(len(patches)):
-            patches[i].center = (self.planets[i].pos[0], self.planets[i].pos[1])
+            patches[i].center = (self.positions[i, 0], self.positions[i, 1])
 
-    def run(self):
+    @staticmethod
+    def animate_recorded(i, patches, trajectory):
+        """ Replays frame i of a recorded Trajectory instead of simulating """
+        frame = trajectory.positions[i]
+        for j in range(len(patches)):
+            patches[j].center = (frame[j, 0], frame[j, 1])
+
+    def run(self, trajectory=None, steps_per_frame=1, target_fps=None):
+        """
+        Animates the simulation, stepped in a background thread (see Animation.LiveAnimation)
+        steps_per_frame: simulation steps per displayed frame, adapted to keep target_fps if that is given
+        trajectory: replays a recorded Trajectory (with the same planets) instead of running the simulation
+        """
+        if trajectory is None:
+            return LiveAnimation(self, steps_per_frame, target_fps).run()
         fig = plt.figure()
         ax = plt.axes()
 
@@ -91,14 +421,42 @@ class Solar:
             ax.add_patch(planet_patch)
             patches.append(planet_patch)
 
-        anim = FuncAnimation(fig, self.animate, fargs=(patches,), interval=1)
+        anim = FuncAnimation(fig, self.animate_recorded, fargs=(patches, trajectory), frames=len(trajectory),
+                             interval=1)
         plt.title("Simulation of the Solar System")
         plt.show()
 
+    def render(self, directory, end_time, steps_per_frame=1, workers=None, video=None, fps=30):
+        """
+        The offline version of run: records the simulation up to end_time (s) into directory/trajectory.bin, renders
+        it into PNG frames on worker processes without a display (see Render), and joins them into a video if one is
+        given and ffmpeg is installed. Returns the video path, or None when there is no video
+        """
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, "trajectory.bin")
+        recorder = self.record(path, every=steps_per_frame)
+        self.run_until(end_time)
+        recorder.close(self)
+        render_frames(path, directory, workers=workers)
+        return None if video is None else encode_video(directory, video, fps)
+
+    @property
+    def indices(self):
+        """ The row of every planet by name (the first one of each name), made on first use """
+        if self._indices is None:
+            self._indices = {}
+            for i, name in enumerate(self.names.tolist()):
+                self._indices.setdefault(name, i)
+        return self._indices
+
+    def index(self, name):
+        """ The row of the named planet in the state arrays """
+        return self.indices[name]
+
     def get_planet(self, p1):
-        for p2 in self.planets:
-            if p2.name == p1:
-                return p2
+        self._check_planets()
+        if p1 in self.indices:
+            return self.planets[self.indices[p1]]
 
     @staticmethod
     def normalise_vec(vector):
@@ -110,16 +468,17 @@ SolarEuler - Implements the Direct / Forward Euler algorithm instead of the Beem
 """
 
 class SolarEuler(Solar):
-    def update_pos(self, planet):
-        planet.current_accel = self.calc_force(planet) / planet.mass
-        # The following is Direct-Euler Formula 1
-        next_pos = planet.pos + (planet.velo * self.timestep)
-        return next_pos
-
-    def update_velo(self, planet):
-        next_accel = self.calc_force(planet) / planet.mass
-        # The following is Direct-Euler Formula 2
-        next_velo = planet.velo + (planet.current_accel * self.timestep)
-        planet.previous_accel = planet.current_accel
-        planet.current_accel = next_accel
-        return next_velo
+    def __init__(self, timestep=100000, force="auto", theta=0.5, snapshot=None, scenario=None):
+        super().__init__(timestep=timestep, force=force, theta=theta, snapshot=snapshot, integrator="euler",
+                         scenario=scenario)
+
+
+"""
+SolarAdaptive - Implements the adaptive Dormand-Prince 5(4) algorithm instead of the Beeman algorithm
+"""
+
+class SolarAdaptive(Solar):
+    def __init__(self, timestep=100000, force="auto", theta=0.5, snapshot=None, tolerance=1e-10, min_timestep=1,
+                 max_timestep=None, scenario=None):
+        super().__init__(timestep=timestep, force=force, theta=theta, snapshot=snapshot, integrator="dopri5",
+                         scenario=scenario, tolerance=tolerance, min_timestep=min_timestep, max_timestep=max_timestep)
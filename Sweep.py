@@ -0,0 +1,96 @@
+"""
+Sweep - Runs an experiment over a grid of parameters on a pool of worker processes
+Results are streamed back in the order the runs finish, with progress reporting and a timeout for every run
+"""
+
+from collections import namedtuple
+import itertools
+import multiprocessing
+import os
+import queue
+import time
+
+
+SweepResult = namedtuple("SweepResult", ["params", "value", "error", "elapsed"])
+
+
+def parameter_grid(grid):
+    """ {"a": [1, 2], "b": [3]} -> [{"a": 1, "b": 3}, {"a": 2, "b": 3}], a list of parameter dicts is kept as it is """
+    if isinstance(grid, dict):
+        names = list(grid)
+        return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+    return [dict(params) for params in grid]
+
+
+def print_progress(done, total, result):
+    status = "done" if result.error is None else "failed (" + result.error + ")"
+    print("[" + str(done) + "/" + str(total) + "] " + str(result.params) + " " + status + " after " +
+          str(round(result.elapsed, 1)) + "s")
+
+
+def _run_task(experiment, index, params, results):
+    """ Runs in a worker process and sends (index, value, error, elapsed) back to the parent """
+    start = time.time()
+    try:
+        value, error = experiment(**params), None
+    except Exception as e:
+        value, error = None, repr(e)
+    results.put((index, value, error, time.time() - start))
+
+
+def run_sweep(experiment, grid, max_workers=None, timeout=None, progress=print_progress):
+    """
+    Calls experiment(**params) for every point of the grid, each in its own worker process, and yields a
+    SweepResult as soon as each run finishes. experiment has to be a module level function so it can be pickled.
+    max_workers caps the number of runs at once (default: one per core), a run that takes longer than timeout
+    seconds is killed and reported with error "timeout", and progress(done, total, result) is called for every
+    result (None to stay quiet)
+    """
+    tasks = parameter_grid(grid)
+    max_workers = max_workers or os.cpu_count() or 1
+    context = multiprocessing.get_context()
+    results = context.Queue()
+    pending = list(enumerate(tasks))[::-1]
+    running = {}    # index -> (process, start time)
+    done = 0
+    try:
+        while pending or running:
+            while pending and len(running) < max_workers:
+                index, params = pending.pop()
+                process = context.Process(target=_run_task, args=(experiment, index, params, results), daemon=True)
+                process.start()
+                running[index] = (process, time.time())
+
+            finished = []
+            try:
+                index, value, error, elapsed = results.get(timeout=0.1)
+                # A run killed for its timeout may still have sent its result, it was reported already
+                if index in running:
+                    running.pop(index)[0].join()
+                    finished.append(SweepResult(tasks[index], value, error, elapsed))
+            except queue.Empty:
+                pass
+
+            # Checked after every result too, so a hung run is killed even while the others keep finishing
+            now = time.time()
+            for index, (process, start) in list(running.items()):
+                if timeout is not None and now - start > timeout:
+                    process.kill()
+                    error = "timeout"
+                elif not process.is_alive() and process.exitcode != 0:
+                    error = "worker exited with code " + str(process.exitcode)
+                else:
+                    continue
+                process.join()
+                del running[index]
+                finished.append(SweepResult(tasks[index], None, error, now - start))
+
+            for result in finished:
+                done += 1
+                if progress is not None:
+                    progress(done, len(tasks), result)
+                yield result
+    finally:
+        for process, start in running.values():
+            process.kill()
+            process.join()
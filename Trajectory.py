@@ -0,0 +1,152 @@
+"""
+Trajectory - Records the states of a Solar simulation to a binary file and reads them back without copying
+File layout: an 8 byte magic, the number of frames (uint64), the header length (uint64), a JSON header with the
+bodies, timestep and integrator, then fixed-size frames of float64 [time, positions (N x 2), velocities (N x 2)]
+"""
+
+import json
+import os
+import numpy as np
+
+
+MAGIC = b"ORBTRAJ1"
+PREFIX_BYTES = 24   # Magic, frame count and header length
+ALIGNMENT = 64      # Frames start on a 64 byte boundary
+
+
+class TrajectoryRecorder:
+    """
+    A Solar hook that streams the state every `every` steps into the file, one chunk of frames at a time:
+    the file is grown by a chunk, the frames are written straight into a memory map of it, which is then flushed
+    and unmapped again, so memory use stays at chunk_bytes however many bodies there are and however long the run is
+    """
+    def __init__(self, path, every=1, chunk_bytes=32 * 2 ** 20):
+        self.path = path
+        self.every = every
+        self.chunk_bytes = chunk_bytes
+        self.chunk_frames = None    # As many frames as fit in chunk_bytes (at least one), once the bodies are known
+        self.n_frames = 0
+        self.steps = 0
+        self.n_bodies = None
+        self._chunk = None
+        self._chunk_used = 0
+        self._file = None
+
+    def attach(self, solar):
+        """ Writes the header and the current state as the first frame, then records after every step """
+        self.n_bodies = len(solar.positions)
+        header = {"names": solar.names.tolist(), "colours": solar.colours.tolist(), "radii": solar.radii.tolist(),
+                  "masses": solar.masses.tolist(), "n_bodies": self.n_bodies, "n_massive": solar.n_massive,
+                  "timestep": solar.timestep, "integrator": solar.integrator.name, "every": self.every,
+                  "G": solar.G}
+        header_bytes = json.dumps(header).encode()
+        self.data_offset = -(-(PREFIX_BYTES + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+        self._file = open(self.path, "wb+")
+        self._file.write(MAGIC + np.array([0, len(header_bytes)], dtype=np.uint64).tobytes() + header_bytes)
+        self._file.truncate(self.data_offset)
+        self.frame_floats = 1 + 4 * self.n_bodies
+        self.chunk_frames = max(1, self.chunk_bytes // (8 * self.frame_floats))
+        self._record(solar)
+        solar.add_hook(self)
+        return self
+
+    def __call__(self, solar):
+        self.steps += 1
+        if self.steps % self.every == 0:
+            self._record(solar)
+
+    def _record(self, solar):
+        if len(solar.positions) != self.n_bodies:
+            raise ValueError("The number of bodies changed while recording a trajectory")
+        if self._chunk is None:
+            offset = self.data_offset + self.n_frames * self.frame_floats * 8
+            self._file.truncate(offset + self.chunk_frames * self.frame_floats * 8)
+            self._file.flush()
+            self._chunk = np.memmap(self._file, dtype=np.float64, mode="r+", offset=offset,
+                                    shape=(self.chunk_frames, self.frame_floats))
+        frame = self._chunk[self._chunk_used]
+        frame[0] = solar.time_passed
+        frame[1:1 + 2 * self.n_bodies] = solar.positions.ravel()
+        frame[1 + 2 * self.n_bodies:] = solar.velocities.ravel()
+        self._chunk_used += 1
+        if self._chunk_used == self.chunk_frames:
+            self.flush()
+
+    def flush(self):
+        """ Writes the frames of the mapped chunk to the file, unmaps it and cuts off the frames it did not use """
+        if self._chunk is None:
+            return
+        chunk, self._chunk = self._chunk, None
+        chunk.flush()
+        del chunk
+        self.n_frames += self._chunk_used
+        self._chunk_used = 0
+        self._file.truncate(self.data_offset + self.n_frames * self.frame_floats * 8)
+        self._file.seek(len(MAGIC))
+        self._file.write(np.array([self.n_frames], dtype=np.uint64).tobytes())
+        self._file.flush()
+
+    def close(self, solar=None):
+        """ Flushes the last frames, and stops recording the given Solar """
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if solar is not None and self in solar.hooks:
+            solar.hooks.remove(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Trajectory:
+    """ Read-only memory map of a recorded trajectory, times / positions / velocities are views into the file """
+    def __init__(self, path):
+        with open(path, "rb") as trajectory_file:
+            prefix = trajectory_file.read(PREFIX_BYTES)
+            if prefix[:len(MAGIC)] != MAGIC:
+                raise ValueError(str(path) + " is not a trajectory file")
+            n_frames, header_length = np.frombuffer(prefix[len(MAGIC):], dtype=np.uint64)
+            self.header = json.loads(trajectory_file.read(int(header_length)))
+        self.data_offset = -(-(PREFIX_BYTES + int(header_length)) // ALIGNMENT) * ALIGNMENT
+        self.n_bodies = self.header["n_bodies"]
+        frame_floats = 1 + 4 * self.n_bodies
+        # Frames that were written before an interrupted run still count, even if the frame count was not updated.
+        # The rest of the last chunk was never written, its times are zero instead of after the frame before
+        in_file = (os.path.getsize(path) - self.data_offset) // (frame_floats * 8)
+        self.frames = np.memmap(path, dtype=np.float64, mode="r", offset=self.data_offset,
+                                shape=(in_file, frame_floats))
+        n_frames = min(int(n_frames), in_file)
+        if in_file > n_frames:
+            times = self.frames[max(n_frames - 1, 0):, 0]
+            unwritten = np.flatnonzero(np.diff(times) <= 0)
+            n_frames = max(n_frames - 1, 0) + (unwritten[0] + 1 if len(unwritten) else len(times))
+        self.frames = self.frames[:n_frames]
+        self.names = self.header["names"]
+        self.masses = np.array(self.header["masses"])
+        self.n_massive = self.header["n_massive"]
+        self.G = self.header["G"]
+        self.timestep = self.header["timestep"]
+        self.integrator = self.header["integrator"]
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def times(self):
+        return self.frames[:, 0]
+
+    @property
+    def positions(self):
+        """ (frames, N, 2) view """
+        return self.frames[:, 1:1 + 2 * self.n_bodies].reshape(len(self.frames), self.n_bodies, 2)
+
+    @property
+    def velocities(self):
+        return self.frames[:, 1 + 2 * self.n_bodies:].reshape(len(self.frames), self.n_bodies, 2)
+
+    def index(self, name):
+        return self.names.index(name)
@@ -0,0 +1,23 @@
+"""
+Shared fixtures - The inner Solar system of input_params.txt built in memory, so the tests need no input files
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Scenario import Scenario
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def scenario():
+    """ The Sun to Mars with the masses, orbits and radii of input_params.txt """
+    return Scenario(np.array(["Sun", "Mercury", "Venus", "Earth", "Mars"]),
+                    np.array([1.989E30, 3.285E23, 4.867E24, 5.972E24, 6.39E23]),
+                    np.array([[0, 0], [5.79E10, 0], [1.082E11, 0], [1.496E11, 0], [2.279E11, 0]], dtype=float),
+                    np.array([[0, 0], [0, 47360], [0, 35020], [0, 29780], [0, 24070]], dtype=float),
+                    np.array([15, 2, 4, 4, 3], dtype=float),
+                    np.array(["yellow", "grey", "orange", "blue", "red"]))
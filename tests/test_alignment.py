@@ -0,0 +1,27 @@
+from DoomsdayPlanetaryAlignment import DoomsdayPlanetaryAlignment
+import numpy as np
+import math
+
+
+THRESHOLDS = [20, 30, 45, 60]
+
+
+def brute_force_years(scenario, threshold):
+    """ The alignment years of one threshold with the spread checked after every step, like the first version """
+    doomsday = DoomsdayPlanetaryAlignment(threshold=threshold, scenario=scenario, log_path=None)
+    limit = threshold * math.pi / 180
+    while doomsday.alignment_spread() < limit:
+        doomsday.solar.run_sim()
+    left_at = doomsday.solar.time_passed
+    while doomsday.alignment_spread() >= limit:
+        doomsday.solar.run_sim()
+    return (doomsday.solar.time_passed - left_at) / doomsday.calc_earth_year()
+
+
+def test_windowed_scan_matches_brute_force(scenario):
+    """ Checking only the predicted windows, for all thresholds in one run, finds the same steps as every step """
+    doomsday = DoomsdayPlanetaryAlignment(scenario=scenario, log_path=None)
+    found = doomsday.write_alignment_years(THRESHOLDS)
+    assert [threshold for threshold, _ in found] == THRESHOLDS
+    np.testing.assert_array_equal([years for _, years in found],
+                                  [brute_force_years(scenario, threshold) for threshold in THRESHOLDS])
@@ -0,0 +1,36 @@
+from Ensemble import Ensemble
+from Solar import Solar
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize("integrator", ["beeman", "euler", "verlet", "yoshida4", "dopri5"])
+def test_unperturbed_ensemble_matches_fork(scenario, integrator):
+    """
+    Started from a warm system, every unperturbed member continues exactly like a fork of it. The dopri5 error norm
+    is summed in another order over the batch, which moves its step sizes (and the time reached) by about 1e-10
+    """
+    rtol = 1e-9 if integrator == "dopri5" else 0
+    solar = Solar(timestep=100000, integrator=integrator, scenario=scenario)
+    for _ in range(20):
+        solar.run_sim()
+    ensemble = Ensemble(solar, members=3, integrator=integrator, **solar.integrator.options)
+    fork = solar.fork()
+    for _ in range(100):
+        ensemble.run_sim()
+        fork.run_sim()
+    assert ensemble.time_passed == pytest.approx(fork.time_passed, rel=rtol, abs=0)
+    for member in range(3):
+        np.testing.assert_allclose(ensemble.positions[member], fork.positions, rtol=0, atol=1 + rtol * 3e11)
+        np.testing.assert_allclose(ensemble.velocities[member], fork.velocities, rtol=0, atol=1e-6 + rtol * 5e4)
+
+
+def test_perturbed_members_start_over(scenario):
+    """ Members with other masses get their own accelerations instead of the snapshot's """
+    solar = Solar(timestep=100000, scenario=scenario)
+    for _ in range(20):
+        solar.run_sim()
+    ensemble = Ensemble(solar, members=4, perturbation={"mass": {"Sun": 1e-3}}, seed=1)
+    expected = ensemble.calc_accels(ensemble.positions, np.zeros_like(ensemble.positions))
+    np.testing.assert_array_equal(ensemble.current_accels, expected)
+    np.testing.assert_array_equal(ensemble.previous_accels, expected)
@@ -0,0 +1,45 @@
+from Forces import DirectSummation, BarnesHut
+import numpy as np
+import pytest
+
+
+def random_system(seed=1, n=500, k=50):
+    """ n planets and k massless test particles scattered around the origin, as (positions, G * masses) """
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=(n + k, 2)) * 1e11, 6.6743E-11 * rng.uniform(1e22, 1e26, n)
+
+
+def accelerations(backend, positions, gm, targets=None, fill=0.0):
+    backend.set_masses(gm, len(positions))
+    return backend.accelerations(positions, np.full_like(positions, fill), targets)
+
+
+@pytest.mark.parametrize("theta", [0.2, 0.5, 0.8])
+def test_tree_error_is_bounded_by_theta(theta):
+    """ The relative error of every body, test particles included, shrinks with theta ** 2 """
+    positions, gm = random_system()
+    exact = accelerations(DirectSummation(), positions, gm)
+    tree = accelerations(BarnesHut(theta=theta), positions, gm)
+    relative = np.linalg.norm(tree - exact, axis=1) / np.linalg.norm(exact, axis=1)
+    assert np.median(relative) < 0.1 * theta ** 2
+    assert np.percentile(relative, 99) < theta ** 2
+
+
+def test_tree_without_approximation_matches_direct_summation():
+    """ With theta = 0 every cell is opened down to single planets, so only rounding is left """
+    positions, gm = random_system()
+    exact = accelerations(DirectSummation(), positions, gm)
+    np.testing.assert_allclose(accelerations(BarnesHut(theta=0), positions, gm), exact, rtol=1e-12, atol=0)
+
+
+@pytest.mark.parametrize("backend", [DirectSummation, BarnesHut])
+def test_targets_only_calculate_their_rows(backend):
+    """ A subset of planets and test particles gets the same accelerations as a full pass, the rest is untouched """
+    positions, gm = random_system()
+    targets = np.random.default_rng(2).choice(len(positions), size=60, replace=False)
+    full = accelerations(backend(), positions, gm)
+    subset = accelerations(backend(), positions, gm, targets, fill=7.0)
+    np.testing.assert_allclose(subset[targets], full[targets], rtol=1e-12, atol=0)
+    others = np.ones(len(positions), dtype=bool)
+    others[targets] = False
+    assert np.all(subset[others] == 7.0)
@@ -0,0 +1,53 @@
+from Lambert import lambert, porkchop, porkchop_sweep, KeplerEphemeris
+from Kepler import kepler_drift
+import numpy as np
+import math
+
+
+MU = 6.6743E-11 * 1.989E30
+AU = 1.496E11
+
+
+def random_transfers(seed=0, n=500):
+    """ Positions between 0.5 and 2 AU in every direction, with times of flight from 30 to 500 days """
+    rng = np.random.default_rng(seed)
+    radii = rng.uniform(0.5, 2, (2, n)) * AU
+    angles = rng.uniform(0, 2 * math.pi, (2, n))
+    r1, r2 = (np.stack([r * np.cos(angle), r * np.sin(angle)], axis=-1) for r, angle in zip(radii, angles))
+    return r1, r2, rng.uniform(30, 500, n) * 86400
+
+
+def test_transfer_lands_on_target():
+    """ Drifting v1 along its conic for the time of flight arrives at r2 with v2 """
+    r1, r2, flight_time = random_transfers()
+    v1, v2 = lambert(r1, r2, flight_time, MU)
+    solved = np.isfinite(v1[:, 0])
+    assert np.mean(solved) > 0.95
+    positions, velocities = kepler_drift(r1[solved], v1[solved], MU, flight_time[solved])
+    np.testing.assert_allclose(positions, r2[solved], rtol=0, atol=1e-6 * AU)
+    np.testing.assert_allclose(velocities, v2[solved], rtol=0, atol=1e-6 * np.max(np.abs(v2[solved])))
+
+
+def test_zero_transfer_angle_is_nan():
+    """ r2 along r1 (exactly, or just either side of it) has no transfer, the same targets turned away from it do """
+    direction = np.array([math.cos(1.3), math.sin(1.3)])
+    r1 = np.tile(direction * AU, (4, 1))
+    r2 = np.array([1.5 * direction, 0.7 * direction, [-direction[1] * 1e-9, direction[0] * 1e-9] + direction * 1.2,
+                   [direction[1] * 1e-9, -direction[0] * 1e-9] + direction * 1.2]) * AU
+    v1, v2 = lambert(r1, r2, 100 * 86400, MU)
+    assert np.all(np.isnan(v1)) and np.all(np.isnan(v2))
+    v1, _ = lambert(r1, r2 @ [[0, 1], [-1, 0]], 100 * 86400, MU)     # The same targets turned by 90 degrees
+    assert np.all(np.isfinite(v1))
+
+
+def test_sweep_in_chunks_matches_porkchop():
+    """ Chunks of two departure dates on worker processes give the same grid as one porkchop call """
+    earth = [AU, 0], [0, 29780]
+    mars = [-1.524 * AU, 0], [0, -24130]
+    ephemeris = KeplerEphemeris(np.array([earth[0], mars[0]]), np.array([earth[1], mars[1]]), MU)
+    departure_times = np.linspace(0, 200, 7) * 86400
+    flight_times = np.linspace(150, 350, 5) * 86400
+    grid = porkchop_sweep(ephemeris, departure_times, flight_times, MU, chunk_cells=10, max_workers=2)
+    expected = porkchop(ephemeris, departure_times, flight_times, MU)
+    for name in ("departure_dv", "arrival_dv", "total_dv"):
+        np.testing.assert_array_equal(grid[name], expected[name])
@@ -0,0 +1,12 @@
+from Solar import Solar
+
+
+def test_profile_none_turns_profiling_off(scenario):
+    solar = Solar(scenario=scenario)
+    profiler = solar.profile()
+    solar.run_sim()
+    assert profiler.totals["run_sim"][0] == 1
+    assert solar.profile(None) is None
+    assert solar.profiler is None
+    solar.run_sim()
+    assert profiler.totals["run_sim"][0] == 1
@@ -0,0 +1,38 @@
+from Solar import Solar
+from Integrators import INTEGRATORS
+import numpy as np
+import pytest
+
+
+def warm_system(scenario, integrator):
+    """ A system 50 steps in, with a satellite just outside Earth's orbit to give block timesteps several levels """
+    solar = Solar(timestep=86400, integrator=integrator, scenario=scenario)
+    earth = solar.index("Earth")
+    solar.add_test_particles(solar.positions[earth] + [1e9, 0], solar.velocities[earth] + [0, 1000])
+    for _ in range(50):
+        solar.run_sim()
+    return solar
+
+
+@pytest.mark.parametrize("integrator", sorted({cls.name for cls in INTEGRATORS.values()}))
+def test_restore_and_rerun_is_reproducible(scenario, integrator, tmp_path):
+    solar = warm_system(scenario, integrator)
+    snapshot = solar.snapshot()
+    solar.save_snapshot(str(tmp_path / "snapshot.npz"))
+    fork = solar.fork()
+    for _ in range(50):
+        solar.run_sim()
+    expected = solar.positions.copy()
+
+    solar.restore(snapshot)
+    loaded = Solar.load_snapshot(str(tmp_path / "snapshot.npz"))
+    for rerun in (solar, fork, loaded):
+        for _ in range(50):
+            rerun.run_sim()
+        np.testing.assert_array_equal(rerun.positions, expected)
+
+
+def test_fast_forward_restarts_block_timesteps(scenario):
+    solar = warm_system(scenario, "block")
+    solar.fast_forward(86400 * 30)
+    assert solar.integrator.levels is None
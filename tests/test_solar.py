@@ -0,0 +1,34 @@
+from Solar import Solar
+from Events import distance_minimum_event
+import numpy as np
+import pytest
+
+
+LAUNCH_TIME = 1007000.0     # In the middle of a step for every timestep below
+END_TIME = 6200000.0
+
+
+def launch_state(solar):
+    """ A satellite 1e6 km from Earth, 3 km/s faster than it """
+    earth = solar.index("Earth")
+    return solar.positions[earth] + [0, 1e9], solar.velocities[earth] + [3000, 0]
+
+
+@pytest.mark.parametrize("timestep", [5000, 20000])
+def test_particle_launched_between_steps_matches_reference(scenario, timestep):
+    """ Launched after the step that passed LAUNCH_TIME and caught up to it, the satellite follows the reference """
+    reference = Solar(timestep=100, scenario=scenario)
+    reference.run_until(LAUNCH_TIME)
+    positions, velocities = launch_state(reference)
+    reference.add_test_particles(positions, velocities)
+    reference.run_until(END_TIME)
+
+    solar = Solar(timestep=timestep, scenario=scenario)
+    solar.add_event(distance_minimum_event(solar.index("Earth"), solar.index("Mars")))   # Keeps the step states
+    solar.run_until(LAUNCH_TIME)
+    assert solar.time_passed > LAUNCH_TIME
+    solar.add_test_particles(positions, velocities, launch_time=LAUNCH_TIME)
+    solar.run_until(END_TIME)
+    assert solar.time_passed == reference.time_passed
+    # About 6e3 * timestep when new particles started with a zero previous acceleration, 1e3 * timestep now
+    assert np.linalg.norm(solar.test_positions[0] - reference.test_positions[0]) < 2e3 * timestep
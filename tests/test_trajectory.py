@@ -0,0 +1,26 @@
+from Solar import Solar
+from Trajectory import Trajectory
+import numpy as np
+
+
+def test_recording_in_small_chunks_reads_back(scenario, tmp_path):
+    """ Chunks of 3 frames (by chunk_bytes), so the run spans several chunks and ends in the middle of one """
+    solar = Solar(scenario=scenario)
+    path = str(tmp_path / "run.traj")
+    recorder = solar.record(path, chunk_bytes=3 * 8 * (1 + 4 * len(solar.positions)))
+    assert recorder.chunk_frames == 3
+    positions = [solar.positions.copy()]
+    for _ in range(10):
+        solar.run_sim()
+        positions.append(solar.positions.copy())
+
+    # Interrupted: the frames of the open chunk are in the file, but not yet in its frame count
+    interrupted = Trajectory(path)
+    assert len(interrupted) == 11
+    np.testing.assert_array_equal(interrupted.positions, positions)
+
+    recorder.close(solar)
+    trajectory = Trajectory(path)
+    assert len(trajectory) == 11
+    np.testing.assert_array_equal(trajectory.positions, positions)
+    np.testing.assert_array_equal(trajectory.times, np.arange(11) * solar.timestep)